@@ -0,0 +1,294 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from docsassist.schema import IndexType, VectorCompression
+
+# search time parameter swept by the tuner for each index type
+TUNABLE_PARAMETERS = {
+    IndexType.IVF: "nprobe",
+    IndexType.IVF_PQ: "nprobe",
+    IndexType.HNSW: "efSearch",
+}
+
+COMPRESSED_INDEX_FILE = "index_{method}.faiss"
+
+
+def default_nlist(n_vectors: int) -> int:
+    """Number of IVF lists, ~4 sqrt(n) but with enough points to train each."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def index_factory_string(
+    index_type: IndexType,
+    n_vectors: int,
+    nlist: Optional[int] = None,
+    hnsw_m: int = 32,
+    pq_m: int = 16,
+) -> str:
+    nlist = nlist or default_nlist(n_vectors)
+    return {
+        IndexType.FLAT: "Flat",
+        IndexType.IVF: f"IVF{nlist},Flat",
+        IndexType.HNSW: f"HNSW{hnsw_m}",
+        IndexType.IVF_PQ: f"IVF{nlist},PQ{pq_m}",
+    }[index_type]
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: IndexType,
+    nlist: Optional[int] = None,
+    hnsw_m: int = 32,
+    pq_m: int = 16,
+) -> faiss.Index:
+    """Build and fill an L2 faiss index of the requested type."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(
+        vectors.shape[1],
+        index_factory_string(index_type, len(vectors), nlist, hnsw_m, pq_m),
+    )
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def apply_search_params(index: Any, params: Dict[str, int]) -> None:
+    """Set search time parameters such as nprobe or efSearch on an index."""
+    parameter_space = faiss.ParameterSpace()
+    for name, value in params.items():
+        parameter_space.set_index_parameter(index, name, value)
+
+
+def enable_reconstruct(index: faiss.Index) -> None:
+    """Let an IVF index return stored vectors, e.g. for MMR re-ranking."""
+    faiss.extract_index_ivf(index).make_direct_map()
+
+
+def recall_at_k(approximate_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours found by the approximate search."""
+    k = exact_ids.shape[1]
+    found = sum(
+        len(np.intersect1d(approximate, exact[exact != -1]))
+        for approximate, exact in zip(approximate_ids, exact_ids)
+    )
+    return found / (len(exact_ids) * k)
+
+
+def _search_latency_ms(index: Any, queries: np.ndarray, k: int) -> float:
+    """Best of three timings of a batch search, per query."""
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        index.search(queries, k)
+        timings.append(time.perf_counter() - start)
+    return 1000 * min(timings) / len(queries)
+
+
+def tune_search_params(
+    index: Any,
+    index_type: IndexType,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    target_recall: float,
+) -> Tuple[Dict[str, int], List[Dict[str, Any]]]:
+    """
+    Pick the cheapest search parameter that reaches `target_recall`.
+
+    Recall@k is measured against an exact search over `vectors` for the
+    held-out `queries`. Larger nprobe/efSearch values are monotonically slower
+    and more accurate, so the first value reaching the target is selected;
+    if none does, the most accurate one is.
+
+    Returns:
+        The chosen parameters and a report with recall and latency per value
+    """
+    parameter = TUNABLE_PARAMETERS.get(index_type)
+    if parameter is None:
+        return {}, []
+
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    _, exact_ids = exact.search(queries, k)
+
+    if parameter == "nprobe":
+        nlist = faiss.extract_index_ivf(index).nlist
+        candidates = [2**i for i in range(int(math.log2(nlist)) + 1)]
+        if candidates[-1] != nlist:
+            candidates.append(nlist)
+    else:
+        candidates = [ef for ef in (16, 32, 64, 128, 256, 512) if ef >= k]
+
+    report = []
+    chosen = candidates[-1]
+    for value in candidates:
+        apply_search_params(index, {parameter: value})
+        _, ids = index.search(queries, k)
+        recall = recall_at_k(ids, exact_ids)
+        report.append(
+            {
+                parameter: value,
+                f"recall@{k}": recall,
+                "latency_ms": _search_latency_ms(index, queries, k),
+            }
+        )
+        if recall >= target_recall:
+            chosen = value
+            break
+
+    params = {parameter: chosen}
+    apply_search_params(index, params)
+    return params, report
+
+
+def compressed_factory_string(
+    method: VectorCompression, dimensions: int, pca_dimensions: int = 128
+) -> str:
+    return {
+        VectorCompression.FLOAT16: "SQfp16",
+        VectorCompression.PCA: f"PCA{min(pca_dimensions, dimensions)},Flat",
+        # one bit per dimension, thresholded at the trained per-dimension median
+        VectorCompression.BINARY: "LSHt",
+    }[method]
+
+
+def build_compressed_index(
+    vectors: np.ndarray, method: VectorCompression, pca_dimensions: int = 128
+) -> faiss.Index:
+    """Build the index searched in the cheap first pass of `CompressedIndex`."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(
+        vectors.shape[1],
+        compressed_factory_string(method, vectors.shape[1], pca_dimensions),
+    )
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def save_compressed_index(
+    folder: str, index: faiss.Index, method: VectorCompression
+) -> None:
+    faiss.write_index(
+        index, os.path.join(folder, COMPRESSED_INDEX_FILE.format(method=method.value))
+    )
+
+
+class CompressedIndex:
+    """Two-pass search: compressed candidates re-ranked at full precision.
+
+    Only the compressed index is held in memory. The full-precision vectors
+    are usually memory-mapped, and only the rows of the candidates are read.
+    Exposes the subset of the `faiss.Index` API used by the LangChain FAISS
+    vector store.
+    """
+
+    def __init__(
+        self, coarse: faiss.Index, vectors: np.ndarray, rerank_candidates: int
+    ) -> None:
+        self.coarse = coarse
+        self.vectors = vectors
+        self.rerank_candidates = rerank_candidates
+        self.ntotal, self.d = vectors.shape
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        _, candidate_ids = self.coarse.search(
+            x, min(max(k, self.rerank_candidates), self.ntotal)
+        )
+        missing = candidate_ids == -1
+        residuals = self.vectors[np.where(missing, 0, candidate_ids)] - x[:, None]
+        distances = np.einsum("qcd,qcd->qc", residuals, residuals)
+        distances[missing] = np.inf
+
+        order = np.argsort(distances, axis=1)[:, :k]
+        result_distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        result_ids = np.full((len(x), k), -1, dtype=np.int64)
+        top = order.shape[1]
+        result_distances[:, :top] = np.take_along_axis(distances, order, axis=1)
+        result_ids[:, :top] = np.take_along_axis(candidate_ids, order, axis=1)
+        result_ids[np.isinf(result_distances)] = -1
+        return result_distances, result_ids
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i])
+
+
+def load_compressed_index(
+    folder: str,
+    method: VectorCompression,
+    vectors: np.ndarray,
+    rerank_candidates: int,
+) -> CompressedIndex:
+    """Open the compressed index written by `save_compressed_index`."""
+    coarse = faiss.read_index(
+        os.path.join(folder, COMPRESSED_INDEX_FILE.format(method=method.value))
+    )
+    return CompressedIndex(coarse, vectors, rerank_candidates)
+
+
+def compression_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    rerank_candidates: int,
+    pca_dimensions: int = 128,
+) -> List[Dict[str, Any]]:
+    """
+    Compare the compression methods against the uncompressed flat index.
+
+    Returns:
+        Index bytes held in memory, search latency per query and recall@k
+        against the exact search, one row per method
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    baseline = faiss.IndexFlatL2(vectors.shape[1])
+    baseline.add(vectors)
+    _, exact_ids = baseline.search(queries, k)
+
+    report = [
+        {
+            "compression": VectorCompression.NONE.value,
+            "index_bytes": len(faiss.serialize_index(baseline)),
+            "latency_ms": _search_latency_ms(baseline, queries, k),
+            f"recall@{k}": 1.0,
+        }
+    ]
+    for method in VectorCompression:
+        if method == VectorCompression.NONE:
+            continue
+        coarse = build_compressed_index(vectors, method, pca_dimensions)
+        index = CompressedIndex(coarse, vectors, rerank_candidates)
+        _, ids = index.search(queries, k)
+        report.append(
+            {
+                "compression": method.value,
+                "index_bytes": len(faiss.serialize_index(coarse)),
+                "latency_ms": _search_latency_ms(index, queries, k),
+                f"recall@{k}": recall_at_k(ids, exact_ids),
+            }
+        )
+    return report
@@ -0,0 +1,475 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import BaseMessage
+
+if TYPE_CHECKING:
+    from docsassist.schema import ResponseCacheSettings, SemanticCacheSettings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    documents: List[Document]
+
+
+@dataclass
+class _SemanticCacheEntry:
+    value: CachedAnswer
+    created: float
+    nbytes: int
+
+
+def _estimate_nbytes(vector: np.ndarray, value: CachedAnswer) -> int:
+    """Rough memory footprint of a cache entry."""
+    return (
+        vector.nbytes
+        + sys.getsizeof(value.answer)
+        + sum(
+            sys.getsizeof(doc.page_content) + sys.getsizeof(str(doc.metadata))
+            for doc in value.documents
+        )
+    )
+
+
+class SemanticCache:
+    """In-process answer cache keyed by question embeddings.
+
+    Question vectors are kept in a NumPy matrix; a lookup is a single
+    matrix-vector product against every cached question. Vectors are
+    expected to be L2 normalized so the product is the cosine similarity.
+    Entries expire after `ttl_seconds` and the least recently used entries
+    are evicted once `max_entries` or `max_memory_mb` is exceeded.
+    """
+
+    def __init__(self, settings: SemanticCacheSettings) -> None:
+        self.settings = settings
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, _SemanticCacheEntry] = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        # creation time of the entry of each vector row
+        self._created = np.empty(settings.max_entries, dtype=np.float64)
+        self._row_ids: List[int] = []
+        self._rows: dict[int, int] = {}
+        self._next_id = 0
+        self._nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, vector: np.ndarray) -> Optional[CachedAnswer]:
+        """Return the answer cached for the most similar question, if any."""
+        with self._lock:
+            self._remove_expired()
+            if self._row_ids:
+                similarities = self._vectors[: len(self._row_ids)] @ vector
+                row = int(np.argmax(similarities))
+                if similarities[row] >= self.settings.similarity_threshold:
+                    entry_id = self._row_ids[row]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return self._entries[entry_id].value
+            self.misses += 1
+            return None
+
+    def add(self, vector: np.ndarray, value: CachedAnswer) -> None:
+        """Cache an answer under its question vector."""
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.empty(
+                    (self.settings.max_entries, vector.shape[0]), dtype=np.float32
+                )
+            entry = _SemanticCacheEntry(
+                value=value,
+                created=time.monotonic(),
+                nbytes=_estimate_nbytes(vector, value),
+            )
+            max_nbytes = self.settings.max_memory_mb * 1024 * 1024
+            # an entry that can never fit does not evict the others
+            if entry.nbytes > max_nbytes:
+                return
+            while self._entries and (
+                len(self._entries) >= self.settings.max_entries
+                or self._nbytes + entry.nbytes > max_nbytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._rows[entry_id] = len(self._row_ids)
+            self._vectors[len(self._row_ids)] = vector
+            self._created[len(self._row_ids)] = entry.created
+            self._row_ids.append(entry_id)
+            self._entries[entry_id] = entry
+            self._nbytes += entry.nbytes
+
+    def _remove(self, entry_id: int) -> None:
+        """Drop an entry, moving the last vector row into its slot."""
+        entry = self._entries.pop(entry_id)
+        self._nbytes -= entry.nbytes
+        row = self._rows.pop(entry_id)
+        last_id = self._row_ids.pop()
+        if last_id != entry_id:
+            self._vectors[row] = self._vectors[len(self._row_ids)]
+            self._created[row] = self._created[len(self._row_ids)]
+            self._row_ids[row] = last_id
+            self._rows[last_id] = row
+
+    def _remove_expired(self) -> None:
+        n_rows = len(self._row_ids)
+        expired = np.flatnonzero(
+            time.monotonic() - self._created[:n_rows] > self.settings.ttl_seconds
+        )
+        for entry_id in [self._row_ids[row] for row in expired]:
+            self._remove(entry_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._row_ids.clear()
+            self._rows.clear()
+            self._nbytes = 0
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "memory_bytes": self._nbytes,
+        }
+
+
+@dataclass
+class _RetrievalCacheEntry:
+    vector: np.ndarray
+    document_ids: Optional[List[str]] = None
+
+
+class RetrievalCache:
+    """LRU cache mapping normalized query text to its embedding and top-k hits.
+
+    A query seen before skips both the embedding model and the index search;
+    a query that was only embedded so far (e.g. for the semantic cache) skips
+    the embedding model.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, _RetrievalCacheEntry] = OrderedDict()
+        self.hits = 0
+        self.embedding_hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[_RetrievalCacheEntry]:
+        key = normalize_question(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if entry.document_ids is None:
+                self.embedding_hits += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def put(
+        self,
+        query: str,
+        vector: np.ndarray,
+        document_ids: Optional[List[str]] = None,
+    ) -> None:
+        key = normalize_question(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and document_ids is None:
+                document_ids = entry.document_ids
+            self._entries[key] = _RetrievalCacheEntry(vector, document_ids)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "embedding_hits": self.embedding_hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+
+class PairScoreCache:
+    """LRU cache of cross-encoder scores of (query, chunk) pairs.
+
+    Chunks are keyed by a digest of their text, so the cache does not keep
+    copies of memory-mapped chunks alive.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, bytes], float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str, text: str) -> tuple[str, bytes]:
+        return (
+            normalize_question(query),
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(),
+        )
+
+    def get_many(self, pairs: Sequence[tuple[str, str]]) -> List[Optional[float]]:
+        keys = [self._key(query, text) for query, text in pairs]
+        scores: List[Optional[float]] = []
+        with self._lock:
+            for key in keys:
+                score = self._entries.get(key)
+                if score is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                scores.append(score)
+        return scores
+
+    def put_many(
+        self, pairs: Sequence[tuple[str, str]], scores: Sequence[float]
+    ) -> None:
+        keys = [self._key(query, text) for query, text in pairs]
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._entries[key] = float(score)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+        }
+
+
+def fingerprint_directory(path: str) -> str:
+    """
+    Hash of the names, sizes and modification times of the files below
+    `path`, used to version the index.
+
+    The files are not read, so memory-mapped indexes stay unloaded.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            stat = os.stat(file_path)
+            digest.update(
+                f"{os.path.relpath(file_path, path)}\0{stat.st_size}\0"
+                f"{stat.st_mtime_ns}\0".encode("utf-8")
+            )
+    return digest.hexdigest()
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of JSON serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.casefold().split())
+
+
+RESPONSE_CACHE_PREFIX = "rag_response_cache_"
+
+
+def _remove_stale_files(path: str) -> None:
+    """Delete the response cache files of other versions next to `path`."""
+    directory, current = os.path.split(path)
+    for name in os.listdir(directory):
+        if not name.startswith(RESPONSE_CACHE_PREFIX):
+            continue
+        database = name.removesuffix("-wal").removesuffix("-shm")
+        if database.endswith(".sqlite3") and database != current:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                logger.warning("Could not remove stale response cache %s", name)
+
+
+class ResponseCache:
+    """Exact-match answer cache backed by a local SQLite file.
+
+    All worker processes on a node open the same file, so an answer produced
+    by one worker is served by the others. Entries are keyed on the
+    normalized question, the chat history and `version`, a fingerprint of the
+    index and model settings; entries and default cache files of any other
+    version are dropped when the cache is opened. The least recently used
+    entries are evicted once `max_entries` is exceeded. Cache errors are
+    logged and treated as misses.
+    """
+
+    def __init__(self, settings: ResponseCacheSettings, version: str) -> None:
+        self.settings = settings
+        self.version = version
+        if settings.path:
+            self.path = settings.path
+        else:
+            # one file per version, the files of earlier versions are deleted
+            # so they do not pile up on long-lived hosts
+            self.path = os.path.join(
+                tempfile.gettempdir(), f"{RESPONSE_CACHE_PREFIX}{version[:16]}.sqlite3"
+            )
+            _remove_stale_files(self.path)
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, "
+                "value TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_last_access "
+                "ON responses (last_access)"
+            )
+            connection.execute(
+                "DELETE FROM responses WHERE version != ?", (self.version,)
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, SQLite connections are not thread safe."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def key(self, question: str, chat_history: Sequence[BaseMessage]) -> str:
+        return fingerprint(
+            self.version,
+            normalize_question(question),
+            [[str(msg.type), str(msg.content)] for msg in chat_history],
+        )
+
+    def get(
+        self, question: str, chat_history: Sequence[BaseMessage]
+    ) -> Optional[CachedAnswer]:
+        """Return the cached answer for this exact question and history."""
+        key = self.key(question, chat_history)
+        try:
+            with self._connection() as connection:
+                row = connection.execute(
+                    "SELECT value FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE responses SET last_access = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+        except sqlite3.Error:
+            logger.warning("Response cache lookup failed", exc_info=True)
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = json.loads(row[0])
+        return CachedAnswer(
+            answer=value["answer"],
+            documents=[Document(**doc) for doc in value["documents"]],
+        )
+
+    def put(
+        self,
+        question: str,
+        chat_history: Sequence[BaseMessage],
+        value: CachedAnswer,
+    ) -> None:
+        """Store an answer and evict the least recently used overflow."""
+        serialized = json.dumps(
+            {
+                "answer": value.answer,
+                "documents": [
+                    {"page_content": doc.page_content, "metadata": doc.metadata}
+                    for doc in value.documents
+                ],
+            },
+            default=str,
+        )
+        try:
+            with self._connection() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (
+                        self.key(question, chat_history),
+                        self.version,
+                        serialized,
+                        time.time(),
+                    ),
+                )
+                (count,) = connection.execute(
+                    "SELECT COUNT(*) FROM responses"
+                ).fetchone()
+                if count > self.settings.max_entries:
+                    connection.execute(
+                        "DELETE FROM responses WHERE key IN ("
+                        "SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                        (count - self.settings.max_entries,),
+                    )
+        except sqlite3.Error:
+            logger.warning("Response cache update failed", exc_info=True)
+
+    @property
+    def stats(self) -> dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,220 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compact, memory-mapped storage for the DIY RAG vector store.
+
+Written by the ingest notebook next to the FAISS files and read by the
+deployment. Vectors, chunk texts and metadata live in flat files that are
+memory-mapped rather than unpickled, so workers share them through the page
+cache and a chunk is only decoded when it is returned as a search hit.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import Mapping
+from typing import Any, Iterator, List, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+FAISS_INDEX_FILE = "index.faiss"
+VECTORS_FILE = "vectors.npy"
+SQUARED_NORMS_FILE = "squared_norms.npy"
+TEXTS_FILE = "texts.bin"
+TEXT_OFFSETS_FILE = "text_offsets.npy"
+METADATA_FILE = "metadata.bin"
+METADATA_OFFSETS_FILE = "metadata_offsets.npy"
+SOURCES_FILE = "sources.json"
+SOURCE_IDS_FILE = "source_ids.npy"
+
+# rows of the corpus scored per block, bounds search memory for large corpora
+SEARCH_BLOCK_SIZE = 65536
+
+
+def _write_blob(
+    folder: str, blob_file: str, offsets_file: str, items: List[bytes]
+) -> None:
+    """Concatenate byte strings into one file with an offsets index."""
+    offsets = np.zeros(len(items) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in items], out=offsets[1:])
+    with open(os.path.join(folder, blob_file), "wb") as f:
+        for item in items:
+            f.write(item)
+    np.save(os.path.join(folder, offsets_file), offsets)
+
+
+def save_compact_store(
+    folder: str, vectors: np.ndarray, documents: List[Document]
+) -> None:
+    """Persist vectors and documents, row i of `vectors` embedding document i."""
+    os.makedirs(folder, exist_ok=True)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    np.save(os.path.join(folder, VECTORS_FILE), vectors)
+    np.save(
+        os.path.join(folder, SQUARED_NORMS_FILE),
+        np.einsum("ij,ij->i", vectors, vectors),
+    )
+
+    # repeated source URLs are stored once and referenced by position
+    sources: dict[str, int] = {}
+    source_ids = np.full(len(documents), -1, dtype=np.int32)
+    metadata_items = []
+    for i, doc in enumerate(documents):
+        metadata = dict(doc.metadata)
+        source = metadata.pop("source", None)
+        if source is not None:
+            source_ids[i] = sources.setdefault(source, len(sources))
+        metadata_items.append(json.dumps(metadata).encode("utf-8") if metadata else b"")
+
+    _write_blob(
+        folder,
+        TEXTS_FILE,
+        TEXT_OFFSETS_FILE,
+        [doc.page_content.encode("utf-8") for doc in documents],
+    )
+    _write_blob(folder, METADATA_FILE, METADATA_OFFSETS_FILE, metadata_items)
+    np.save(os.path.join(folder, SOURCE_IDS_FILE), source_ids)
+    with open(os.path.join(folder, SOURCES_FILE), "w", encoding="utf-8") as f:
+        json.dump(list(sources), f)
+
+
+def _map_bytes(path: str) -> Union[np.memmap, bytes]:
+    # np.memmap cannot map an empty file
+    if os.path.getsize(path) == 0:
+        return b""
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+class MmapDocstore(Docstore):
+    """Read-only docstore over the memory-mapped files of `save_compact_store`.
+
+    Documents are addressed by their row in the index.
+    """
+
+    def __init__(self, folder: str) -> None:
+        self._texts = _map_bytes(os.path.join(folder, TEXTS_FILE))
+        self._text_offsets = np.load(
+            os.path.join(folder, TEXT_OFFSETS_FILE), mmap_mode="r"
+        )
+        self._metadata = _map_bytes(os.path.join(folder, METADATA_FILE))
+        self._metadata_offsets = np.load(
+            os.path.join(folder, METADATA_OFFSETS_FILE), mmap_mode="r"
+        )
+        self._source_ids = np.load(os.path.join(folder, SOURCE_IDS_FILE), mmap_mode="r")
+        with open(os.path.join(folder, SOURCES_FILE), encoding="utf-8") as f:
+            self._sources = json.load(f)
+
+    def __len__(self) -> int:
+        return len(self._source_ids)
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        i = int(search)
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        text = bytes(
+            self._texts[self._text_offsets[i] : self._text_offsets[i + 1]]
+        ).decode("utf-8")
+        raw_metadata = bytes(
+            self._metadata[self._metadata_offsets[i] : self._metadata_offsets[i + 1]]
+        )
+        metadata = json.loads(raw_metadata) if raw_metadata else {}
+        if self._source_ids[i] >= 0:
+            metadata["source"] = self._sources[self._source_ids[i]]
+        return Document(page_content=text, metadata=metadata)
+
+
+class RowIds(Mapping):
+    """Identity mapping from index rows to `MmapDocstore` ids."""
+
+    def __init__(self, n: int) -> None:
+        self._n = n
+
+    def __getitem__(self, i: int) -> int:
+        if not 0 <= i < self._n:
+            raise KeyError(i)
+        return int(i)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self._n))
+
+    def __len__(self) -> int:
+        return self._n
+
+
+class MmapFlatIndex:
+    """Exact L2 search over memory-mapped vectors.
+
+    Exposes the subset of the `faiss.IndexFlatL2` API used by the LangChain
+    FAISS vector store. faiss reads flat indexes fully into memory even with
+    `IO_FLAG_MMAP`, so the vectors are searched with NumPy instead.
+    """
+
+    def __init__(self, vectors: np.ndarray, squared_norms: np.ndarray) -> None:
+        self.vectors = vectors
+        self.squared_norms = squared_norms
+        self.ntotal, self.d = vectors.shape
+
+    def search(self, x: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        x = np.asarray(x, dtype=np.float32)
+        query_norms = np.einsum("ij,ij->i", x, x)[:, None]
+        candidate_distances = []
+        candidate_ids = []
+        for start in range(0, self.ntotal, SEARCH_BLOCK_SIZE):
+            block = self.vectors[start : start + SEARCH_BLOCK_SIZE]
+            distances = (
+                self.squared_norms[start : start + SEARCH_BLOCK_SIZE]
+                - 2 * x @ block.T
+                + query_norms
+            )
+            top = min(k, len(block))
+            ids = np.argpartition(distances, top - 1, axis=1)[:, :top]
+            candidate_distances.append(np.take_along_axis(distances, ids, axis=1))
+            candidate_ids.append(ids + start)
+
+        result_distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        result_ids = np.full((len(x), k), -1, dtype=np.int64)
+        if candidate_ids:
+            distances = np.concatenate(candidate_distances, axis=1)
+            ids = np.concatenate(candidate_ids, axis=1)
+            order = np.argsort(distances, axis=1)[:, :k]
+            top = order.shape[1]
+            result_distances[:, :top] = np.take_along_axis(distances, order, axis=1)
+            result_ids[:, :top] = np.take_along_axis(ids, order, axis=1)
+        return result_distances, result_ids
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return np.array(self.vectors[i])
+
+
+def load_compact_index(folder: str, approximate: bool = False) -> Any:
+    """Open the index of a vector store written by `save_compact_store`.
+
+    With `approximate`, the ANN index saved by `FAISS.save_local` is searched
+    instead of the raw vectors; faiss memory-maps the inverted lists of IVF
+    indexes. Pair it with `MmapDocstore` and `RowIds` for a pickle-free
+    LangChain FAISS vector store.
+    """
+    if approximate:
+        return faiss.read_index(
+            os.path.join(folder, FAISS_INDEX_FILE),
+            faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY,
+        )
+    return MmapFlatIndex(
+        np.load(os.path.join(folder, VECTORS_FILE), mmap_mode="r"),
+        np.load(os.path.join(folder, SQUARED_NORMS_FILE), mmap_mode="r"),
+    )
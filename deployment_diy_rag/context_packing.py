@@ -0,0 +1,150 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Assembly of retrieved chunks into the context of the QA prompt.
+
+Chunks are written with an overlap, so neighbouring hits from the same source
+often repeat each other. Overlapping chunks are merged back into one passage
+using the start offsets recorded at ingest, and passages are packed by rank
+into a token budget using the token counts recorded at ingest.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+TOKEN_COUNT_KEY = "token_count"
+START_INDEX_KEY = "start_index"
+
+# rough estimate for chunks ingested without a token count
+CHARS_PER_TOKEN = 4
+
+
+def annotate_token_counts(
+    documents: List[Document], encoding_name: str = "o200k_base"
+) -> None:
+    """Store the number of tokens of each chunk in its metadata."""
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+    encoded = encoding.encode_batch(
+        [doc.page_content for doc in documents], disallowed_special=()
+    )
+    for doc, tokens in zip(documents, encoded):
+        doc.metadata[TOKEN_COUNT_KEY] = len(tokens)
+
+
+def token_count(doc: Document) -> int:
+    count = doc.metadata.get(TOKEN_COUNT_KEY)
+    if count is None:
+        return math.ceil(len(doc.page_content) / CHARS_PER_TOKEN)
+    return int(count)
+
+
+def _merge_pair(first: Document, second: Document) -> Document:
+    """Merge two chunks of one source, `second` starting inside or right after `first`."""
+    first_start = first.metadata[START_INDEX_KEY]
+    first_end = first_start + len(first.page_content)
+    second_start = second.metadata[START_INDEX_KEY]
+    new_text = second.page_content[first_end - second_start :]
+    if not new_text:
+        return first
+    # the tokens of the new text are estimated from the cached chunk counts
+    new_tokens = math.ceil(
+        token_count(second) * len(new_text) / len(second.page_content)
+    )
+    return Document(
+        page_content=first.page_content + new_text,
+        metadata={
+            **first.metadata,
+            TOKEN_COUNT_KEY: token_count(first) + new_tokens,
+        },
+    )
+
+
+def merge_overlapping(documents: List[Document]) -> List[Document]:
+    """
+    Merge overlapping or adjacent chunks of the same source.
+
+    Passages are returned in the order of their best ranked chunk. Chunks
+    without a start offset are only deduplicated.
+    """
+    ranks: Dict[int, int] = {}
+    passages: List[Document] = []
+    by_source: Dict[str, List[int]] = {}
+    seen = set()
+    for rank, doc in enumerate(documents):
+        if doc.page_content in seen:
+            continue
+        seen.add(doc.page_content)
+        if START_INDEX_KEY in doc.metadata:
+            by_source.setdefault(doc.metadata.get("source", ""), []).append(rank)
+        else:
+            ranks[len(passages)] = rank
+            passages.append(doc)
+
+    for source_ranks in by_source.values():
+        source_ranks.sort(key=lambda rank: documents[rank].metadata[START_INDEX_KEY])
+        merged = documents[source_ranks[0]]
+        best_rank = source_ranks[0]
+        for rank in source_ranks[1:]:
+            doc = documents[rank]
+            merged_end = merged.metadata[START_INDEX_KEY] + len(merged.page_content)
+            if doc.metadata[START_INDEX_KEY] <= merged_end:
+                merged = _merge_pair(merged, doc)
+                best_rank = min(best_rank, rank)
+            else:
+                ranks[len(passages)] = best_rank
+                passages.append(merged)
+                merged, best_rank = doc, rank
+        ranks[len(passages)] = best_rank
+        passages.append(merged)
+
+    order = sorted(range(len(passages)), key=ranks.__getitem__)
+    return [passages[i] for i in order]
+
+
+def _truncate(doc: Document, max_tokens: int) -> Document:
+    n_chars = len(doc.page_content) * max_tokens // token_count(doc)
+    return Document(
+        page_content=doc.page_content[:n_chars],
+        metadata={**doc.metadata, TOKEN_COUNT_KEY: max_tokens},
+    )
+
+
+def pack_context(
+    documents: List[Document], max_tokens: int, merge: bool = True
+) -> List[Document]:
+    """
+    Pack ranked chunks into a token budget.
+
+    Passages are taken in rank order and skipped when they no longer fit, so a
+    smaller lower ranked passage may still be included. The top passage is
+    truncated if it alone exceeds the budget.
+    """
+    passages = merge_overlapping(documents) if merge else documents
+    packed: List[Document] = []
+    used = 0
+    for doc in passages:
+        tokens = token_count(doc)
+        if used + tokens <= max_tokens:
+            packed.append(doc)
+            used += tokens
+        elif not packed:
+            packed.append(_truncate(doc, max_tokens))
+            used = max_tokens
+    return packed
@@ -13,28 +13,28 @@
 # limitations under the License.
 
 # mypy: ignore-errors
+import asyncio
 import os
+import pickle
 import sys
-from collections.abc import Iterator
-from typing import Union
+import time
+import traceback
+from collections.abc import AsyncIterator, Iterator
+from typing import Callable, Optional, Sequence, TypeVar, Union
 
+import faiss
+import numpy as np
+import openai
 import pandas as pd
 import yaml
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import (
-    create_history_aware_retriever,
-)
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.schema.runnable import Runnable
 from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
 )
-from langchain_core.vectorstores import VectorStoreRetriever
-from langchain_huggingface import (
-    HuggingFaceEmbeddings,
-)
 from langchain_openai import AzureChatOpenAI
 from openai.types.chat import (
     ChatCompletion,
@@ -42,34 +42,173 @@ from openai.types.chat import (
     CompletionCreateParams,
 )
 
+from caching import (
+    CachedAnswer,
+    ResponseCache,
+    RetrievalCache,
+    SemanticCache,
+    fingerprint,
+    fingerprint_directory,
+)
+from compact_store import (
+    FAISS_INDEX_FILE,
+    VECTORS_FILE,
+    MmapDocstore,
+    RowIds,
+    load_compact_index,
+)
+from context_packing import pack_context
+from event_loop import gather_with_concurrency, iterate_sync, run_sync
+from metrics import LLMCallMetrics, RequestMetrics, elapsed_ms
+from onnx_embeddings import OnnxEmbeddings
+from rate_limit import RateLimitedTransport, openai_default_transport
+from reranking import CrossEncoderReranker
+from retrieval import CachedVectorStoreRetriever
+from sparse_index import SparseIndex
+from startup import LoadReport, warmup
 from utils import (
+    RAGModel,
+    aanswer_question,
+    astream_answer,
     convert_messages_to_chat_history,
     create_chat_completion,
+    create_chat_completion_chunk,
+    create_result_dict,
+    history_key,
     merge_result_dicts,
     parse_chat_history,
-    process_single_row,
+    process_citations,
 )
 
 sys.path.append("../")
 
+from ann_index import (
+    apply_search_params,
+    enable_reconstruct,
+    load_compressed_index,
+)
 from docsassist.credentials import AzureOpenAICredentials
-from docsassist.schema import PROMPT_COLUMN_NAME, TARGET_COLUMN_NAME, RAGModelSettings
+from docsassist.schema import (
+    PROMPT_COLUMN_NAME,
+    TARGET_COLUMN_NAME,
+    EmbeddingBackend,
+    IndexLoadMode,
+    IndexType,
+    RAGModelSettings,
+    SearchType,
+    VectorCompression,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, just "
+    "reformulate it if needed and otherwise return it as is."
+)
+
+
+def get_embedding_function(input_dir, model_settings: RAGModelSettings):
+    """Query embedding model, exported to ONNX by the ingest notebook if selected."""
+    if model_settings.embedding_backend == EmbeddingBackend.SENTENCE_TRANSFORMERS:
+        # not loaded by deployments embedding with ONNX Runtime
+        from langchain_huggingface import HuggingFaceEmbeddings
+
+        return HuggingFaceEmbeddings(
+            model_name=model_settings.embedding_model_name,
+            cache_folder=input_dir + "/sentencetransformers",
+        )
+    return OnnxEmbeddings(
+        input_dir + "/onnx_embeddings",
+        quantized=model_settings.embedding_backend == EmbeddingBackend.ONNX_INT8,
+    )
 
 
 def get_chain(
-    input_dir, credentials: AzureOpenAICredentials, model_settings: RAGModelSettings
+    input_dir,
+    credentials: AzureOpenAICredentials,
+    model_settings: RAGModelSettings,
+    report: Optional[LoadReport] = None,
 ):
-    """Instantiate the RAG chain."""
-    embedding_function = HuggingFaceEmbeddings(
-        model_name=model_settings.embedding_model_name,
-        cache_folder=input_dir + "/sentencetransformers",
-    )
-    db = FAISS.load_local(
-        folder_path=input_dir + "/faiss_db",
-        embeddings=embedding_function,
-        allow_dangerous_deserialization=True,
+    """Instantiate the RAG chain and keep handles on its stages for batch scoring."""
+    report = report or LoadReport()
+    faiss_db = input_dir + "/faiss_db"
+    with report.stage("embedding_model"):
+        embedding_function = get_embedding_function(input_dir, model_settings)
+
+    compression = model_settings.vector_compression
+    mmap = model_settings.index_load_mode == IndexLoadMode.MMAP
+    with report.stage("faiss_index"):
+        if compression.method != VectorCompression.NONE:
+            # the full-precision vectors are memory-mapped for the re-rank
+            index = load_compressed_index(
+                faiss_db,
+                compression.method,
+                np.load(f"{faiss_db}/{VECTORS_FILE}", mmap_mode="r"),
+                compression.rerank_candidates,
+            )
+        elif mmap:
+            index = load_compact_index(
+                faiss_db, approximate=model_settings.index_type != IndexType.FLAT
+            )
+        else:
+            index = faiss.read_index(f"{faiss_db}/{FAISS_INDEX_FILE}")
+        if (
+            compression.method == VectorCompression.NONE
+            and model_settings.index_search_params
+        ):
+            apply_search_params(index, model_settings.index_search_params)
+        if (
+            model_settings.retrieval.search_type == SearchType.MMR
+            and compression.method == VectorCompression.NONE
+            and model_settings.index_type in (IndexType.IVF, IndexType.IVF_PQ)
+        ):
+            enable_reconstruct(index)
+
+    with report.stage("docstore"):
+        if mmap:
+            docstore = MmapDocstore(faiss_db)
+            index_to_docstore_id = RowIds(index.ntotal)
+        else:
+            # written by FAISS.save_local in the ingest notebook
+            with open(f"{faiss_db}/index.pkl", "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+    sparse_index = None
+    hybrid_search = model_settings.hybrid_search
+    if hybrid_search.enabled:
+        with report.stage("sparse_index"):
+            sparse_index = SparseIndex(
+                faiss_db, k1=hybrid_search.bm25_k1, b=hybrid_search.bm25_b
+            )
+    reranker = None
+    if model_settings.rerank.enabled:
+        with report.stage("reranker"):
+            reranker = CrossEncoderReranker(
+                input_dir + "/cross_encoder", model_settings.rerank
+            )
+    db = FAISS(
+        embedding_function=embedding_function,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
     )
+    with report.stage("chain"):
+        return build_rag_model(
+            db, credentials, model_settings, faiss_db, sparse_index, reranker
+        )
+
 
+def build_rag_model(
+    db: FAISS,
+    credentials: AzureOpenAICredentials,
+    model_settings: RAGModelSettings,
+    faiss_db: str,
+    sparse_index: Optional[SparseIndex] = None,
+    reranker: Optional[CrossEncoderReranker] = None,
+) -> RAGModel:
     llm = AzureChatOpenAI(
         deployment_name=credentials.azure_deployment,
         azure_endpoint=credentials.azure_endpoint,
@@ -80,28 +219,49 @@ def get_chain(
         verbose=True,
         max_retries=model_settings.max_retries,
         request_timeout=model_settings.request_timeout,
+        # every LLM call of the process is paced to the Azure OpenAI quota
+        http_async_client=openai.DefaultAsyncHttpxClient(
+            transport=RateLimitedTransport(
+                model_settings.llm_rate_limit,
+                openai_default_transport(credentials.azure_endpoint),
+            ),
+            # the proxy is set on the transport, proxy mounts would bypass it
+            trust_env=False,
+        ),
     )
-    retriever = VectorStoreRetriever(
+    retrieval = model_settings.retrieval
+    search_type = retrieval.search_type.value
+    if search_type == SearchType.SIMILARITY and retrieval.score_threshold is not None:
+        search_type = "similarity_score_threshold"
+    search_kwargs = retrieval.model_dump(exclude={"search_type"}, exclude_none=True)
+    if reranker is not None:
+        # the re-ranker picks the chunks of the prompt among more candidates
+        search_kwargs["k"] = model_settings.rerank.candidates
+    retriever = CachedVectorStoreRetriever(
         vectorstore=db,
+        # LangChain's names for the search settings
+        search_type=search_type,
+        search_kwargs=search_kwargs,
+        cache=(
+            RetrievalCache(model_settings.retrieval_cache.max_entries)
+            if model_settings.retrieval_cache.enabled
+            else None
+        ),
+        sparse_index=sparse_index,
+        fusion_candidates=model_settings.hybrid_search.candidates,
+        dense_weight=model_settings.hybrid_search.dense_weight,
+        sparse_weight=model_settings.hybrid_search.sparse_weight,
+        rrf_k=model_settings.hybrid_search.rrf_k,
     )
     system_template = model_settings.stuff_prompt
-    contextualize_q_system_prompt = (
-        "Given a chat history and the latest user question "
-        "which might reference context in the chat history, "
-        "formulate a standalone question which can be understood "
-        "without the chat history. Do NOT answer the question, just "
-        "reformulate it if needed and otherwise return it as is."
-    )
     contextualize_q_prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", contextualize_q_system_prompt),
+            ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ]
     )
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
+    question_rewriter = contextualize_q_prompt | llm | StrOutputParser()
 
     # Answer question
     qa_system_prompt = system_template
@@ -116,63 +276,416 @@ def get_chain(
     # into the LLM. Note that we can also use StuffDocumentsChain and other
     # instances of BaseCombineDocumentsChain.
     question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-    return rag_chain
+    # streamed answers only report their token usage when asked to; the
+    # option is rejected on non-streamed calls, so it gets its own chain
+    streaming_answer_chain = create_stuff_documents_chain(
+        llm.bind(stream_options={"include_usage": True}), qa_prompt
+    )
+
+    response_cache = None
+    if model_settings.response_cache.enabled:
+        # any change to the index or the prompts yields a new cache version
+        response_cache = ResponseCache(
+            model_settings.response_cache,
+            version=fingerprint(
+                fingerprint_directory(faiss_db),
+                model_settings.model_dump(mode="json"),
+                CONTEXTUALIZE_Q_SYSTEM_PROMPT,
+            ),
+        )
+    return RAGModel(
+        settings=model_settings,
+        retriever=retriever,
+        question_rewriter=question_rewriter,
+        question_answer_chain=question_answer_chain,
+        streaming_answer_chain=streaming_answer_chain,
+        semantic_cache=(
+            SemanticCache(model_settings.semantic_cache)
+            if model_settings.semantic_cache.enabled
+            else None
+        ),
+        response_cache=response_cache,
+        reranker=reranker,
+    )
 
 
 def load_model(input_dir):
-    """Load vector database and prepare chain."""
-    with open(os.path.join(input_dir, RAGModelSettings.filename())) as f:
-        model_settings = RAGModelSettings.model_validate(yaml.safe_load(f))
-    credentials = AzureOpenAICredentials()
-    chain = get_chain(input_dir, credentials=credentials, model_settings=model_settings)
-    return chain
+    """
+    Load vector database and prepare chain.
+
+    The model is warmed up before it is returned, so DRUM only reports the
+    replica ready once the first request no longer pays for lazy
+    initialisation. Load time and RSS per component are logged.
+    """
+    report = LoadReport()
+    with report.stage("settings"):
+        with open(os.path.join(input_dir, RAGModelSettings.filename())) as f:
+            model_settings = RAGModelSettings.model_validate(yaml.safe_load(f))
+        credentials = AzureOpenAICredentials()
+    model = get_chain(
+        input_dir, credentials=credentials, model_settings=model_settings, report=report
+    )
+    if model_settings.warmup.enabled:
+        warmup(model, model_settings.warmup, report)
+    model.load_report = report.as_dict()
+    report.log()
+    return model
 
 
-def score(data: pd.DataFrame, model: Runnable, **kwargs) -> pd.DataFrame:
+async def _run_batch_stage(
+    stage: Callable[[list[T]], Sequence[R]], items: list[T]
+) -> tuple[dict[T, R], dict[T, dict]]:
+    """
+    Run a batched stage of `ascore` in one call, or item by item if it fails.
+
+    Returns the results by item and, for items that failed on their own, the
+    error result of their rows, so one bad row does not fail the batch.
+    """
+    if not items:
+        return {}, {}
+    try:
+        return dict(zip(items, await asyncio.to_thread(stage, items))), {}
+    except Exception:
+        pass
+    results: dict[T, R] = {}
+    failed: dict[T, dict] = {}
+    for item in items:
+        try:
+            (results[item],) = await asyncio.to_thread(stage, [item])
+        except Exception:
+            failed[item] = {TARGET_COLUMN_NAME: [traceback.format_exc()]}
+    return results, failed
+
+
+async def ascore(data: pd.DataFrame, model: RAGModel) -> pd.DataFrame:
+    """
+    Orchestrate RAG completions for a batch of rows on the event loop.
+
+    The batch is processed in stages rather than row by row: follow-up
+    questions are rewritten into standalone questions, all standalone
+    questions are embedded and searched in one FAISS call, their candidates
+    are re-ranked in one cross-encoder pass, and identical rows share a
+    single LLM call. A failing batch stage is retried row by row, so an
+    invalid row only fails itself. LLM stages run concurrently, bounded by
+    `max_concurrency`; output rows keep the order of the input rows and carry
+    per-stage latency, token and cost columns.
+    """
+    max_concurrency = model.settings.max_concurrency
+    results: dict[int, dict] = {}
+    # unique (question, chat history) pairs and the rows that share them
+    requests = {}
+    row_keys = {}
+    for i, (_, row) in enumerate(data.iterrows()):
+        try:
+            question = row[PROMPT_COLUMN_NAME]
+            # a missing prompt is read as None or NaN
+            if not isinstance(question, str):
+                raise ValueError(
+                    f"{PROMPT_COLUMN_NAME} must be a string, got {question!r}"
+                )
+            chat_history = parse_chat_history(row.get("messages", ""))
+        except Exception:
+            results[i] = {TARGET_COLUMN_NAME: [traceback.format_exc()]}
+            continue
+        key = (question, history_key(chat_history))
+        requests.setdefault(key, (question, chat_history))
+        row_keys[i] = key
+
+    metrics = {key: RequestMetrics() for key in requests}
+
+    async def _standalone_question(key):
+        question, chat_history = requests[key]
+        if not chat_history:
+            return question
+        return await _arewrite_question(model, question, chat_history, metrics[key])
+
+    async def _try_standalone_question(key):
+        try:
+            return await _standalone_question(key), None
+        except Exception:
+            return None, {TARGET_COLUMN_NAME: [traceback.format_exc()]}
+
+    keys = list(requests)
+    standalone = {}
+    answered = {}
+    if model.response_cache is not None:
+        cached = await asyncio.to_thread(
+            lambda: {key: model.response_cache.get(*requests[key]) for key in keys}
+        )
+        for key, value in cached.items():
+            if value is not None:
+                answered[key] = create_result_dict(
+                    value.answer,
+                    process_citations(value.documents),
+                    target_column_name=TARGET_COLUMN_NAME,
+                    metrics=metrics[key],
+                )
+        keys = [key for key in keys if key not in answered]
+
+    rewritten = await gather_with_concurrency(
+        [_try_standalone_question(key) for key in keys], max_concurrency
+    )
+    for key, (query, error) in zip(keys, rewritten):
+        if error is None:
+            standalone[key] = query
+        else:
+            answered[key] = error
+    pending = list(standalone)
+
+    # embedding and search are CPU bound, keep them off the event loop
+    queries = list(dict.fromkeys(standalone.values()))
+    start = time.perf_counter()
+    query_vectors, failed = await _run_batch_stage(model.retriever.embed, queries)
+    for key in pending:
+        metrics[key].timings["embedding"] = elapsed_ms(start)
+        if standalone[key] in failed:
+            answered[key] = failed[standalone[key]]
+    pending = [key for key in pending if key not in answered]
+
+    if model.semantic_cache is not None:
+        for key in pending:
+            if requests[key][1]:
+                continue
+            cached = model.semantic_cache.lookup(query_vectors[standalone[key]])
+            if cached is not None:
+                answered[key] = create_result_dict(
+                    cached.answer,
+                    process_citations(cached.documents),
+                    target_column_name=TARGET_COLUMN_NAME,
+                    metrics=metrics[key],
+                )
+        pending = [key for key in pending if key not in answered]
+
+    start = time.perf_counter()
+    documents, failed = await _run_batch_stage(
+        lambda keys: model.retriever.retrieve_batch(
+            [standalone[key] for key in keys], query_vectors
+        ),
+        pending,
+    )
+    for key in pending:
+        metrics[key].timings["search"] = elapsed_ms(start)
+    answered.update(failed)
+    pending = [key for key in pending if key not in answered]
+    if model.reranker is not None:
+        # one cross-encoder pass for the candidates of the whole batch
+        start = time.perf_counter()
+        documents, failed = await _run_batch_stage(
+            lambda keys: model.reranker.rerank(
+                [standalone[key] for key in keys], [documents[key] for key in keys]
+            ),
+            pending,
+        )
+        for key in pending:
+            metrics[key].timings["rerank"] = elapsed_ms(start)
+        answered.update(failed)
+        pending = [key for key in pending if key not in answered]
+    contexts = {key: _assemble_context(model, documents[key]) for key in pending}
+
+    async def _answer(key):
+        question, chat_history = requests[key]
+        try:
+            answer = await aanswer_question(
+                question,
+                chat_history,
+                contexts[key],
+                model.question_answer_chain,
+                metrics[key],
+            )
+            await _store_in_caches(
+                model,
+                question,
+                chat_history,
+                None if chat_history else query_vectors[standalone[key]],
+                CachedAnswer(answer, contexts[key]),
+            )
+        except Exception:
+            return {TARGET_COLUMN_NAME: [traceback.format_exc()]}
+        return create_result_dict(
+            answer,
+            process_citations(contexts[key]),
+            target_column_name=TARGET_COLUMN_NAME,
+            metrics=metrics[key],
+        )
+
+    answers = await gather_with_concurrency(
+        [_answer(key) for key in pending], max_concurrency
+    )
+    answered.update(zip(pending, answers))
+    for i, key in row_keys.items():
+        results[i] = answered[key]
+
+    final_result = merge_result_dicts([results[i] for i in range(len(data))])
+    return pd.DataFrame(final_result)
+
+
+def score(data: pd.DataFrame, model: RAGModel, **kwargs) -> pd.DataFrame:
     """
     Orchestrate a RAG completion with our vector database.
 
     Args:
         data: Input DataFrame containing questions and optional message history
-        model: LangChain chain
+        model: RAG chain, its stages and the settings it was built with
         **kwargs: Additional arguments
 
     Returns:
         DataFrame with answers and citations
     """
-    chain = model
-    results = []
-
-    for _, row in data.iterrows():
-        question = row[PROMPT_COLUMN_NAME]
-        chat_history = parse_chat_history(row.get("messages", ""))
-        result = process_single_row(
-            question, chat_history, chain, target_column_name=TARGET_COLUMN_NAME
-        )
-        results.append(result)
+    return run_sync(ascore(data, model))
 
-    final_result = merge_result_dicts(results)
-    return pd.DataFrame(final_result)
 
+async def _lookup_caches(
+    model: RAGModel, question: str, chat_history: list, metrics: RequestMetrics
+) -> tuple[Optional[np.ndarray], Optional[CachedAnswer]]:
+    """
+    Look a question up in the exact-match cache, then in the semantic cache.
 
-def chat(
-    completion_params: CompletionCreateParams,
-    model: Runnable,
-) -> Union[ChatCompletion, Iterator[ChatCompletionChunk]]:
+    Returns the embedding of a first-turn question when the semantic cache
+    is enabled, so that a miss can later be stored and retrieved under it.
     """
-    OpenAI-compatible chat function that uses a LangChain RAG chain under the hood.
+    if model.response_cache is not None:
+        cached = await asyncio.to_thread(
+            model.response_cache.get, question, chat_history
+        )
+        if cached is not None:
+            return None, cached
+    if model.semantic_cache is None or chat_history:
+        return None, None
+    with metrics.time("embedding"):
+        vectors = await asyncio.to_thread(model.retriever.embed, [question])
+    return vectors[0], model.semantic_cache.lookup(vectors[0])
 
-    Args:
-        completion_params: OpenAI-style completion parameters
-        model: LangChain chain
 
-    Returns:
-        ChatCompletion or Iterator[ChatCompletionChunk]
+async def _store_in_caches(
+    model: RAGModel,
+    question: str,
+    chat_history: list,
+    query_vector: Optional[np.ndarray],
+    value: CachedAnswer,
+) -> None:
+    """Store a freshly generated answer in the enabled caches."""
+    if model.response_cache is not None:
+        await asyncio.to_thread(model.response_cache.put, question, chat_history, value)
+    if model.semantic_cache is not None and query_vector is not None:
+        model.semantic_cache.add(query_vector, value)
+
+
+async def _arewrite_question(
+    model: RAGModel, question: str, chat_history: list, metrics: RequestMetrics
+) -> str:
+    """Rewrite a follow-up question into a standalone question."""
+    calls = LLMCallMetrics()
+    with metrics.time("rewrite"):
+        standalone = await model.question_rewriter.ainvoke(
+            {"input": question, "chat_history": chat_history},
+            config={"callbacks": [calls]},
+        )
+    metrics.add_usage(calls)
+    return standalone
+
+
+def _assemble_context(model: RAGModel, documents: list[Document]) -> list[Document]:
+    """Merge overlapping chunks and pack them into the context token budget."""
+    settings = model.settings.context_packing
+    if not settings.enabled:
+        return documents
+    return pack_context(
+        documents, settings.max_tokens, merge=settings.merge_overlapping
+    )
+
+
+async def _aretrieve(
+    model: RAGModel,
+    question: str,
+    chat_history: list,
+    query_vector: Optional[np.ndarray],
+    metrics: RequestMetrics,
+) -> list[Document]:
+    """Retrieve the context of a question, as the history-aware retriever does."""
+    standalone = question
+    if chat_history:
+        standalone = await _arewrite_question(model, question, chat_history, metrics)
+    if query_vector is None:
+        with metrics.time("embedding"):
+            query_vector = (
+                await asyncio.to_thread(model.retriever.embed, [standalone])
+            )[0]
+    with metrics.time("search"):
+        (documents,) = await asyncio.to_thread(
+            model.retriever.retrieve_batch, [standalone], {standalone: query_vector}
+        )
+    if model.reranker is not None:
+        with metrics.time("rerank"):
+            (documents,) = await asyncio.to_thread(
+                model.reranker.rerank, [standalone], [documents]
+            )
+    return _assemble_context(model, documents)
+
+
+async def astream_chat_completion(
+    model: RAGModel, question: str, chat_history: list, model_name: str
+) -> AsyncIterator[ChatCompletionChunk]:
+    """
+    Stream the RAG chain as OpenAI ChatCompletionChunks.
+
+    The first chunk carries the citations as soon as retrieval finishes, the
+    following chunks carry answer tokens as the LLM produces them and the last
+    chunk carries the finish reason, token usage and per-stage timings.
     """
-    chain = model
+    completion_id = f"chat-{int(time.time())}"
+    created_time = int(time.time())
+    metrics = RequestMetrics()
+
+    query_vector, cached = await _lookup_caches(model, question, chat_history, metrics)
+    context = (
+        cached.documents
+        if cached is not None
+        else await _aretrieve(model, question, chat_history, query_vector, metrics)
+    )
+    yield create_chat_completion_chunk(
+        completion_id,
+        model_name,
+        created_time,
+        content="",
+        role="assistant",
+        citations=context,
+    )
+
+    if cached is not None:
+        yield create_chat_completion_chunk(
+            completion_id, model_name, created_time, content=cached.answer
+        )
+    else:
+        answer_parts = []
+        async for token in astream_answer(
+            question, chat_history, context, model.streaming_answer_chain, metrics
+        ):
+            if token:
+                answer_parts.append(token)
+                yield create_chat_completion_chunk(
+                    completion_id, model_name, created_time, content=token
+                )
+        await _store_in_caches(
+            model,
+            question,
+            chat_history,
+            query_vector,
+            CachedAnswer("".join(answer_parts), context),
+        )
 
-    # Extract messages from completion params
+    yield create_chat_completion_chunk(
+        completion_id,
+        model_name,
+        created_time,
+        finish_reason="stop",
+        metrics=metrics,
+    )
+
+
+def parse_completion_params(
+    completion_params: CompletionCreateParams,
+) -> tuple[str, list]:
+    """Split OpenAI-style messages into the latest user message and chat history."""
     messages = completion_params.get("messages", [])
 
     # Convert messages to chat history
@@ -186,11 +699,68 @@ def chat(
     if user_message is None:
         raise ValueError("No user message found in completion params")
 
-    # Run the chain with chat history
-    response = chain.invoke({"input": user_message, "chat_history": chat_history})
+    return user_message, chat_history
+
+
+async def achat(
+    completion_params: CompletionCreateParams,
+    model: RAGModel,
+) -> ChatCompletion:
+    """Async, non-streaming counterpart of `chat`."""
+    user_message, chat_history = parse_completion_params(completion_params)
+    metrics = RequestMetrics()
+
+    query_vector, cached = await _lookup_caches(
+        model, user_message, chat_history, metrics
+    )
+    if cached is not None:
+        return create_chat_completion(
+            cached.answer,
+            completion_params.get("model"),
+            citations=cached.documents,
+            metrics=metrics,
+        )
+
+    context = await _aretrieve(model, user_message, chat_history, query_vector, metrics)
+    answer = await aanswer_question(
+        user_message, chat_history, context, model.question_answer_chain, metrics
+    )
+    await _store_in_caches(
+        model,
+        user_message,
+        chat_history,
+        query_vector,
+        CachedAnswer(answer, context),
+    )
 
     return create_chat_completion(
-        response["answer"],
+        answer,
         completion_params.get("model"),
-        citations=response["context"],
+        citations=context,
+        metrics=metrics,
     )
+
+
+def chat(
+    completion_params: CompletionCreateParams,
+    model: RAGModel,
+) -> Union[ChatCompletion, Iterator[ChatCompletionChunk]]:
+    """
+    OpenAI-compatible chat function that uses a LangChain RAG chain under the hood.
+
+    Args:
+        completion_params: OpenAI-style completion parameters
+        model: RAG chain and the settings it was built with
+
+    Returns:
+        ChatCompletion, or Iterator[ChatCompletionChunk] when `stream` is requested
+    """
+    if completion_params.get("stream"):
+        user_message, chat_history = parse_completion_params(completion_params)
+        return iterate_sync(
+            astream_chat_completion(
+                model, user_message, chat_history, completion_params.get("model")
+            )
+        )
+
+    return run_sync(achat(completion_params, model))
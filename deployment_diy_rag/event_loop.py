@@ -0,0 +1,95 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, Coroutine, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class BackgroundEventLoop:
+    """A per-process asyncio event loop running on a daemon thread.
+
+    Synchronous entry points (the DRUM hooks) submit coroutines to this loop
+    and block on the result, so every in-flight request shares one loop
+    instead of pinning a worker thread while it waits on network I/O.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._pid: int | None = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # a forked worker inherits the loop object but not its thread
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._pid = os.getpid()
+                threading.Thread(
+                    target=self._loop.run_forever,
+                    name="rag-event-loop",
+                    daemon=True,
+                ).start()
+            return self._loop
+
+    def run(self, coro: Coroutine[object, object, T]) -> T:
+        """Run a coroutine on the background loop and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def iterate(self, iterator: AsyncIterator[T]) -> Iterator[T]:
+        """Drive an async iterator on the background loop from sync code."""
+        loop = self.loop
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(
+                        iterator.__anext__(), loop
+                    ).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None:
+                asyncio.run_coroutine_threadsafe(aclose(), loop).result()
+
+
+_EVENT_LOOP = BackgroundEventLoop()
+
+
+def run_sync(coro: Coroutine[object, object, T]) -> T:
+    """Run a coroutine on the process-wide event loop."""
+    return _EVENT_LOOP.run(coro)
+
+
+def iterate_sync(iterator: AsyncIterator[T]) -> Iterator[T]:
+    """Iterate an async iterator on the process-wide event loop."""
+    return _EVENT_LOOP.iterate(iterator)
+
+
+async def gather_with_concurrency(
+    coros: list[Coroutine[object, object, T]], max_concurrency: int
+) -> list[T]:
+    """Await coroutines concurrently, at most `max_concurrency` at a time."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _bounded(coro: Coroutine[object, object, T]) -> T:
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(_bounded(coro) for coro in coros))
@@ -0,0 +1,143 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_community.callbacks.openai_info import OpenAICallbackHandler
+from langchain_core.outputs import LLMResult
+from openai.types import CompletionUsage
+
+# request stages, in pipeline order
+STAGES = (
+    "rewrite",
+    "embedding",
+    "search",
+    "rerank",
+    "prompt",
+    "llm_first_token",
+    "llm_total",
+)
+
+
+class LLMCallMetrics(OpenAICallbackHandler):
+    """Token usage, cost and timing of the LLM calls of one runnable invocation.
+
+    Non-streamed calls deliver their first token with the full response, so
+    their time to first token is the total LLM time. Calls whose response
+    reports no token usage are flagged rather than counted as zero tokens.
+    """
+
+    run_inline: bool = True
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.created = time.perf_counter()
+        self.llm_start: Optional[float] = None
+        self.first_token: Optional[float] = None
+        self.llm_end: Optional[float] = None
+        self.usage_missing = False
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], *args, **kwargs) -> None:
+        self.llm_start = time.perf_counter()
+
+    def on_llm_start(self, serialized: Dict[str, Any], *args, **kwargs) -> None:
+        self.llm_start = time.perf_counter()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if self.first_token is None and token:
+            self.first_token = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.llm_end = time.perf_counter()
+        tokens_before = self.total_tokens
+        super().on_llm_end(response, **kwargs)
+        if self.total_tokens == tokens_before:
+            self.usage_missing = True
+
+
+def _ms(start: Optional[float], end: Optional[float]) -> Optional[float]:
+    if start is None or end is None:
+        return None
+    return round(1000 * (end - start), 1)
+
+
+def elapsed_ms(start: float) -> Optional[float]:
+    """Milliseconds since a `time.perf_counter()` reading."""
+    return _ms(start, time.perf_counter())
+
+
+@dataclass
+class RequestMetrics:
+    """Per-stage latency in milliseconds and LLM usage of one RAG request.
+
+    Batched stages are shared by the requests of a batch, each of which
+    records the duration of the whole stage.
+    """
+
+    timings: Dict[str, Optional[float]] = field(
+        default_factory=lambda: dict.fromkeys(STAGES)
+    )
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_cost: float = 0.0
+    # an LLM call of the request reported no usage, so the totals are unknown
+    usage_missing: bool = False
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = _ms(start, time.perf_counter())
+
+    def add_usage(self, calls: LLMCallMetrics) -> None:
+        self.prompt_tokens += calls.prompt_tokens
+        self.completion_tokens += calls.completion_tokens
+        self.total_cost += calls.total_cost
+        self.usage_missing = self.usage_missing or calls.usage_missing
+
+    def add_answer(self, calls: LLMCallMetrics) -> None:
+        """Record the prompt assembly and LLM timings of the answer call."""
+        self.timings["prompt"] = _ms(calls.created, calls.llm_start)
+        self.timings["llm_first_token"] = _ms(
+            calls.llm_start, calls.first_token or calls.llm_end
+        )
+        self.timings["llm_total"] = _ms(calls.llm_start, calls.llm_end)
+        self.add_usage(calls)
+
+    def usage(self) -> Optional[CompletionUsage]:
+        if self.usage_missing:
+            return None
+        return CompletionUsage(
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            total_tokens=self.prompt_tokens + self.completion_tokens,
+            cost=self.total_cost,
+        )
+
+    def as_columns(self) -> Dict[str, List[Any]]:
+        """Extra `score` output columns."""
+        columns: Dict[str, List[Any]] = {
+            f"LATENCY_{stage.upper()}_MS": [ms] for stage, ms in self.timings.items()
+        }
+        usage = self.usage()
+        columns["PROMPT_TOKENS"] = [usage.prompt_tokens if usage else None]
+        columns["COMPLETION_TOKENS"] = [usage.completion_tokens if usage else None]
+        columns["TOTAL_COST"] = [self.total_cost if usage else None]
+        return columns
@@ -0,0 +1,199 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+ONNX Runtime backend for sentence-transformers embeddings.
+
+`export_onnx_model` runs once in the ingest notebook, where PyTorch is
+installed, and writes the transformer graph, its tokenizer and the pooling
+configuration to a folder shipped with the deployment. `OnnxEmbeddings` then
+embeds with onnxruntime and tokenizers only.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+ONNX_MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "embedding_config.json"
+
+SUPPORTED_POOLING_MODES = ("mean", "cls", "max")
+
+
+def export_onnx_model(
+    model_name: str, cache_folder: str, output_dir: str, quantize: bool = True
+) -> None:
+    """Export a sentence-transformers model to ONNX, optionally with int8 weights."""
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    model = SentenceTransformer(model_name, cache_folder=cache_folder, device="cpu")
+    transformer = model[0]
+    pooling = next(module for module in model if isinstance(module, models.Pooling))
+    pooling_mode = pooling.get_pooling_mode_str()
+    if pooling_mode not in SUPPORTED_POOLING_MODES:
+        raise ValueError(f"Unsupported pooling mode for ONNX export: {pooling_mode}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = transformer.tokenizer
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+
+    sample = tokenizer(["An example sentence"], return_tensors="pt")
+    input_names = [
+        name
+        for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in sample
+    ]
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, auto_model: torch.nn.Module) -> None:
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+            return self.auto_model(**dict(zip(input_names, inputs)))[0]
+
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(transformer.auto_model.eval()),
+            tuple(sample[name] for name in input_names),
+            os.path.join(output_dir, ONNX_MODEL_FILE),
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={
+                name: {0: "batch", 1: "sequence"}
+                for name in input_names + ["token_embeddings"]
+            },
+            opset_version=14,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            os.path.join(output_dir, ONNX_MODEL_FILE),
+            os.path.join(output_dir, QUANTIZED_MODEL_FILE),
+            weight_type=QuantType.QInt8,
+        )
+
+    with open(os.path.join(output_dir, CONFIG_FILE), "w") as f:
+        json.dump(
+            {
+                "input_names": input_names,
+                "pooling_mode": pooling_mode,
+                "normalize": any(isinstance(m, models.Normalize) for m in model),
+                "max_seq_length": model.max_seq_length,
+                "pad_token": tokenizer.pad_token,
+                "pad_token_id": tokenizer.pad_token_id,
+            },
+            f,
+        )
+
+
+class OnnxEmbeddings(Embeddings):
+    """Embeddings computed by a model written by `export_onnx_model`."""
+
+    def __init__(
+        self,
+        model_dir: str,
+        quantized: bool = False,
+        batch_size: int = 32,
+        intra_op_num_threads: Optional[int] = None,
+    ) -> None:
+        # not loaded by deployments embedding with sentence-transformers
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(
+            pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"]
+        )
+
+        options = onnxruntime.SessionOptions()
+        if intra_op_num_threads is not None:
+            options.intra_op_num_threads = intra_op_num_threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(
+                model_dir, QUANTIZED_MODEL_FILE if quantized else ONNX_MODEL_FILE
+            ),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+
+    def _pool(self, token_embeddings: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        pooling_mode = self.config["pooling_mode"]
+        if pooling_mode == "cls":
+            return token_embeddings[:, 0]
+        if pooling_mode == "max":
+            return np.where(mask[..., None] > 0, token_embeddings, -np.inf).max(axis=1)
+        summed = np.einsum("bsd,bs->bd", token_embeddings, mask)
+        return summed / np.clip(mask.sum(axis=1, keepdims=True), 1e-9, None)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs: Dict[str, np.ndarray] = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array(
+                [e.attention_mask for e in encodings], dtype=np.int64
+            ),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        (token_embeddings,) = self.session.run(
+            None, {name: inputs[name] for name in self.config["input_names"]}
+        )
+        embeddings = self._pool(
+            token_embeddings, inputs["attention_mask"].astype(np.float32)
+        )
+        if self.config["normalize"]:
+            embeddings /= np.clip(
+                np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None
+            )
+        return embeddings.astype(np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        texts = [text.replace("\n", " ") for text in texts]
+        return np.concatenate(
+            [
+                self._embed_batch(texts[start : start + self.batch_size])
+                for start in range(0, len(texts), self.batch_size)
+            ]
+        ).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def embedding_parity(
+    reference: Embeddings, candidate: Embeddings, texts: List[str]
+) -> Dict[str, float]:
+    """Cosine similarity between the two models' embeddings of the same texts."""
+    a = np.asarray(reference.embed_documents(texts), dtype=np.float32)
+    b = np.asarray(candidate.embed_documents(texts), dtype=np.float32)
+    cosine = np.einsum("ij,ij->i", a, b) / (
+        np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1)
+    )
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
@@ -0,0 +1,209 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Client-side pacing of the Azure OpenAI calls of the DIY RAG deployment.
+
+All LLM requests of a process go through one `RateLimitedTransport`, the
+HTTP transport of the `AzureChatOpenAI` client. Requests and their estimated
+tokens are paced by token buckets matching the deployment quota, and
+throttled (429) requests are retried after their Retry-After delay or a
+jittered exponential backoff.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import json
+import logging
+import math
+import random
+import threading
+import time
+import urllib.request
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+import openai
+
+from context_packing import CHARS_PER_TOKEN
+
+if TYPE_CHECKING:
+    from docsassist.schema import LLMRateLimitSettings
+
+logger = logging.getLogger(__name__)
+
+# Azure OpenAI enforces per-minute quotas over windows of a few seconds, so
+# the buckets only hold a few seconds worth of quota
+BURST_SECONDS = 10.0
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute`.
+
+    Callers reserve their amount up front and wait for the returned delay,
+    so concurrent callers are served in order and never poll.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take `amount` and return the seconds until it is available."""
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(
+                self.capacity, self._level + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # the level goes negative while reservations wait for the refill
+            self._level -= amount
+            return max(0.0, -self._level / self.rate)
+
+
+def estimate_request_tokens(content: bytes, expected_completion_tokens: int) -> int:
+    """
+    Tokens a chat completion request counts against the quota.
+
+    Like Azure OpenAI, counts the prompt and the maximum number of completion
+    tokens.
+    """
+    try:
+        body = json.loads(content)
+    except ValueError:
+        return expected_completion_tokens
+    prompt_chars = sum(
+        len(str(message.get("content") or "")) for message in body.get("messages", [])
+    )
+    return math.ceil(prompt_chars / CHARS_PER_TOKEN) + (
+        body.get("max_tokens") or expected_completion_tokens
+    )
+
+
+def retry_after_seconds(headers: httpx.Headers) -> Optional[float]:
+    """Delay requested by a throttled response, if any."""
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def openai_default_transport(endpoint: str) -> httpx.AsyncHTTPTransport:
+    """
+    Transport the default openai client would use for `endpoint`.
+
+    Keeps openai's connection limits and the proxy and SSL environment
+    variables, which httpx ignores once a client is given a transport.
+    """
+    url = httpx.URL(endpoint)
+    proxies = urllib.request.getproxies()
+    proxy = None
+    if not urllib.request.proxy_bypass(url.host):
+        proxy = proxies.get(url.scheme) or proxies.get("all")
+    return httpx.AsyncHTTPTransport(
+        limits=openai.DEFAULT_CONNECTION_LIMITS, proxy=proxy, trust_env=True
+    )
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    HTTP transport pacing requests to the request and token quotas.
+
+    A Retry-After delay pauses all requests of the transport, not only the
+    throttled one, since the quota is shared.
+    """
+
+    def __init__(
+        self,
+        settings: LLMRateLimitSettings,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._transport = transport or httpx.AsyncHTTPTransport()
+        self.requests = (
+            TokenBucket(settings.requests_per_minute)
+            if settings.requests_per_minute
+            else None
+        )
+        self.tokens = (
+            TokenBucket(settings.tokens_per_minute)
+            if settings.tokens_per_minute
+            else None
+        )
+        self.expected_completion_tokens = settings.expected_completion_tokens
+        self.max_attempts = settings.max_attempts
+        self.initial_backoff = settings.initial_backoff_seconds
+        self.max_backoff = settings.max_backoff_seconds
+        self._paused_until = 0.0
+        self.throttled = 0
+
+    async def _wait_for_quota(self, tokens: int) -> None:
+        delay = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, no shorter than Retry-After."""
+        backoff = random.uniform(
+            0, min(self.max_backoff, self.initial_backoff * 2**attempt)
+        )
+        return backoff if retry_after is None else max(backoff, retry_after)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        tokens = estimate_request_tokens(
+            request.content, self.expected_completion_tokens
+        )
+        attempt = 0
+        while True:
+            # throttled attempts keep their reservation, erring on the side
+            # of the quota
+            await self._wait_for_quota(tokens)
+            response = await self._transport.handle_async_request(request)
+            attempt += 1
+            if response.status_code != 429 or attempt >= self.max_attempts:
+                return response
+            self.throttled += 1
+            retry_after = retry_after_seconds(response.headers)
+            if retry_after is not None:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+            delay = self._backoff(attempt - 1, retry_after)
+            await response.aclose()
+            logger.info("LLM request throttled, retrying in %.1fs", delay)
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
@@ -0,0 +1,135 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from caching import PairScoreCache
+
+if TYPE_CHECKING:
+    from docsassist.schema import RerankSettings
+
+logger = logging.getLogger(__name__)
+
+# weight of the latest batch in the running estimate of the scoring time
+_LATENCY_SMOOTHING = 0.2
+
+
+class CrossEncoderReranker:
+    """
+    Keeps the best chunks of each query by cross-encoder score.
+
+    The (query, chunk) pairs of all queries are scored in one batched pass
+    and pair scores are cached. One pass runs at a time; when the model is
+    busy and waiting for it plus the expected scoring time would exceed the
+    time budget, the chunks are passed on in retrieval order instead.
+    """
+
+    def __init__(self, model_dir: str, settings: RerankSettings) -> None:
+        # imports PyTorch, which deployments without re-ranking may not load
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_dir, device="cpu")
+        self.top_n = settings.top_n
+        self.batch_size = settings.batch_size
+        self.time_budget = (
+            settings.time_budget_ms / 1000
+            if settings.time_budget_ms is not None
+            else None
+        )
+        self.cache = (
+            PairScoreCache(settings.cache_max_entries)
+            if settings.cache_max_entries
+            else None
+        )
+        self._lock = threading.Lock()
+        self._seconds_per_pair: Optional[float] = None
+        self.skipped = 0
+
+    def _acquire(self, n_pairs: int) -> bool:
+        """
+        Wait for the model unless scoring could no longer finish in time.
+
+        An idle model is always used, so only load makes re-ranking skip.
+        """
+        if self.time_budget is None:
+            return self._lock.acquire()
+        if self._lock.acquire(blocking=False):
+            return True
+        timeout = self.time_budget - n_pairs * (self._seconds_per_pair or 0.0)
+        return timeout > 0 and self._lock.acquire(timeout=timeout)
+
+    def _score(self, pairs: List[tuple[str, str]]) -> Optional[List[float]]:
+        scores: List[Optional[float]] = (
+            self.cache.get_many(pairs)
+            if self.cache is not None
+            else [None] * len(pairs)
+        )
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if not missing:
+            return scores
+        if not self._acquire(len(missing)):
+            return None
+        try:
+            start = time.perf_counter()
+            predicted = self.model.predict(
+                [pairs[i] for i in missing],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+            seconds_per_pair = (time.perf_counter() - start) / len(missing)
+        finally:
+            self._lock.release()
+
+        self._seconds_per_pair = (
+            seconds_per_pair
+            if self._seconds_per_pair is None
+            else _LATENCY_SMOOTHING * seconds_per_pair
+            + (1 - _LATENCY_SMOOTHING) * self._seconds_per_pair
+        )
+        if self.cache is not None:
+            self.cache.put_many([pairs[i] for i in missing], predicted)
+        for i, score in zip(missing, predicted):
+            scores[i] = float(score)
+        return scores
+
+    def rerank(
+        self, queries: List[str], documents: List[List[Document]]
+    ) -> List[List[Document]]:
+        """Best `top_n` chunks of each query, best first."""
+        pairs = [
+            (query, doc.page_content)
+            for query, docs in zip(queries, documents)
+            for doc in docs
+        ]
+        scores = self._score(pairs) if pairs else []
+        if scores is None:
+            self.skipped += 1
+            logger.info("Skipped re-ranking of %d chunks over time budget", len(pairs))
+            return [docs[: self.top_n] for docs in documents]
+
+        reranked = []
+        start = 0
+        for docs in documents:
+            query_scores = np.asarray(scores[start : start + len(docs)])
+            start += len(docs)
+            order = np.argsort(-query_scores, kind="stable")[: self.top_n]
+            reranked.append([docs[i] for i in order])
+        return reranked
@@ -0,0 +1,263 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores.faiss import FAISS
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStoreRetriever
+
+from caching import RetrievalCache
+from sparse_index import SparseIndex
+
+DEFAULT_K = 4
+DEFAULT_FETCH_K = 20
+DEFAULT_LAMBDA_MULT = 0.5
+
+# BM25 runs here while the calling thread runs the FAISS search
+_sparse_search_pool = ThreadPoolExecutor(thread_name_prefix="bm25")
+
+
+def embed_queries(vectorstore: FAISS, queries: List[str]) -> np.ndarray:
+    """Embed all queries in a single call to the embedding model."""
+    vectors = np.asarray(
+        vectorstore.embedding_function.embed_documents(queries), dtype=np.float32
+    )
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def reconstruct_vectors(vectorstore: FAISS, indices: np.ndarray) -> np.ndarray:
+    """Stored vectors of the given index rows."""
+    vectors = np.empty((len(indices), vectorstore.index.d), dtype=np.float32)
+    for row, i in enumerate(indices):
+        vectors[row] = vectorstore.index.reconstruct(int(i))
+    return vectors
+
+
+def maximal_marginal_relevance(
+    query: np.ndarray, candidates: np.ndarray, k: int, lambda_mult: float
+) -> List[int]:
+    """
+    Select `k` candidates balancing similarity to the query and diversity.
+
+    Same selection as LangChain's `maximal_marginal_relevance`, but cosine
+    similarities between all candidates are computed once and the maximum
+    similarity to the selected set is updated incrementally.
+    """
+    if k <= 0 or len(candidates) == 0:
+        return []
+    candidates = candidates / np.clip(
+        np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12, None
+    )
+    relevance = candidates @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[selected[0]].copy()
+    available = np.ones(len(candidates), dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, len(candidates)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    return selected
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[np.ndarray], weights: Sequence[float], rrf_k: int = 60
+) -> np.ndarray:
+    """
+    Fuse ranked lists of index rows, best first.
+
+    A row scores `weight / (rrf_k + rank)` in each list it appears in, ranks
+    starting at 1. Ties keep the order in which rows are first seen.
+    """
+    scores: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, row in enumerate(ranking, start=1):
+            scores[int(row)] = scores.get(int(row), 0.0) + weight / (rrf_k + rank)
+    return np.array(
+        sorted(scores, key=scores.__getitem__, reverse=True), dtype=np.int64
+    )
+
+
+def get_documents(vectorstore: FAISS, document_ids: List[str]) -> List[Document]:
+    return [vectorstore.docstore.search(document_id) for document_id in document_ids]
+
+
+class CachedVectorStoreRetriever(VectorStoreRetriever):
+    """VectorStoreRetriever that caches query embeddings and their top-k hits.
+
+    Also retrieves for many queries at once: identical queries are embedded
+    and searched only once, and all remaining queries are embedded in one call
+    and searched in one multi-query FAISS search.
+
+    With a `sparse_index`, BM25 and FAISS are searched concurrently and their
+    top `fusion_candidates` hits are fused by reciprocal rank fusion.
+    """
+
+    cache: Optional[RetrievalCache] = None
+    sparse_index: Optional[SparseIndex] = None
+    fusion_candidates: int = 20
+    dense_weight: float = 1.0
+    sparse_weight: float = 1.0
+    rrf_k: int = 60
+
+    @property
+    def k(self) -> int:
+        return self.search_kwargs.get("k", DEFAULT_K)
+
+    def _dense_search(self, vectors: np.ndarray, k: int) -> List[np.ndarray]:
+        """Rows of the `k` nearest chunks of each query above `score_threshold`."""
+        distances, indices = self.vectorstore.index.search(vectors, k)
+        score_threshold = self.search_kwargs.get("score_threshold")
+        relevance_score_fn = self.vectorstore._select_relevance_score_fn()
+
+        results = []
+        for row_distances, row_indices in zip(distances, indices):
+            keep = row_indices != -1
+            if score_threshold is not None:
+                keep &= (
+                    np.array([relevance_score_fn(d) for d in row_distances])
+                    >= score_threshold
+                )
+            results.append(row_indices[keep])
+        return results
+
+    def _hybrid_search(
+        self, queries: List[str], vectors: np.ndarray, k: int
+    ) -> List[np.ndarray]:
+        """Rows of the `k` best chunks of each query by fused BM25 and FAISS ranks."""
+        depth = max(self.fusion_candidates, k)
+        sparse = _sparse_search_pool.submit(self.sparse_index.search, queries, depth)
+        dense = self._dense_search(vectors, depth)
+        return [
+            reciprocal_rank_fusion(
+                [dense_rows, sparse_rows],
+                [self.dense_weight, self.sparse_weight],
+                self.rrf_k,
+            )[:k]
+            for dense_rows, sparse_rows in zip(dense, sparse.result())
+        ]
+
+    def search_ids(self, queries: List[str], vectors: np.ndarray) -> List[List[str]]:
+        """
+        Search the chunks of many queries at once and return their docstore ids.
+
+        Honours the `search_type` of the retriever: dense hits below
+        `score_threshold` are dropped and with MMR, `k` hits are selected
+        among `fetch_k` candidates. Row i of `vectors` embeds `queries[i]`.
+        """
+        if len(vectors) == 0:
+            return []
+        mmr = self.search_type == "mmr"
+        fetch_k = max(self.search_kwargs.get("fetch_k", DEFAULT_FETCH_K), self.k)
+        k = fetch_k if mmr else self.k
+        if self.sparse_index is None:
+            candidates = self._dense_search(vectors, k)
+        else:
+            candidates = self._hybrid_search(queries, vectors, k)
+
+        results = []
+        for vector, row_indices in zip(vectors, candidates):
+            if mmr:
+                row_indices = row_indices[
+                    maximal_marginal_relevance(
+                        vector,
+                        reconstruct_vectors(self.vectorstore, row_indices),
+                        self.k,
+                        self.search_kwargs.get("lambda_mult", DEFAULT_LAMBDA_MULT),
+                    )
+                ]
+            results.append(
+                [self.vectorstore.index_to_docstore_id[int(i)] for i in row_indices]
+            )
+        return results
+
+    def embed(self, queries: List[str]) -> np.ndarray:
+        """Embed queries, reusing cached embeddings."""
+        vectors: Dict[str, np.ndarray] = {}
+        if self.cache is not None:
+            for query in dict.fromkeys(queries):
+                entry = self.cache.get(query)
+                if entry is not None:
+                    vectors[query] = entry.vector
+        missing = [query for query in dict.fromkeys(queries) if query not in vectors]
+        if missing:
+            for query, vector in zip(missing, embed_queries(self.vectorstore, missing)):
+                vectors[query] = vector
+                if self.cache is not None:
+                    self.cache.put(query, vector)
+        if not queries:
+            return np.empty((0, self.vectorstore.index.d), dtype=np.float32)
+        return np.stack([vectors[query] for query in queries])
+
+    def retrieve_batch(
+        self,
+        queries: List[str],
+        query_vectors: Optional[Dict[str, np.ndarray]] = None,
+    ) -> List[List[Document]]:
+        """Retrieve documents for many queries at once.
+
+        Queries found in `query_vectors` are not embedded again.
+        """
+        query_vectors = dict(query_vectors or {})
+        document_ids: Dict[str, List[str]] = {}
+        to_search: List[str] = []
+        for query in dict.fromkeys(queries):
+            entry = self.cache.get(query) if self.cache is not None else None
+            if entry is not None and entry.document_ids is not None:
+                document_ids[query] = entry.document_ids
+                continue
+            to_search.append(query)
+            if entry is not None:
+                query_vectors.setdefault(query, entry.vector)
+
+        to_embed = [query for query in to_search if query not in query_vectors]
+        if to_embed:
+            query_vectors.update(
+                zip(to_embed, embed_queries(self.vectorstore, to_embed))
+            )
+        if to_search:
+            vectors = np.stack([query_vectors[query] for query in to_search])
+            for query, ids in zip(to_search, self.search_ids(to_search, vectors)):
+                document_ids[query] = ids
+                if self.cache is not None:
+                    self.cache.put(query, query_vectors[query], ids)
+
+        return [get_documents(self.vectorstore, document_ids[q]) for q in queries]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return self.retrieve_batch([query])[0]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return (await asyncio.to_thread(self.retrieve_batch, [query]))[0]
@@ -0,0 +1,133 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+BM25 keyword index of the DIY RAG chunks.
+
+Written by the ingest notebook next to the FAISS files, row i indexing the
+same chunk as row i of the FAISS index. Postings are stored as flat arrays:
+the documents and term frequencies of term t are the slice
+`offsets[t]:offsets[t + 1]` of `doc_ids` and `term_freqs`, so the index is
+memory-mapped rather than unpickled.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+TERMS_FILE = "bm25_terms.json"
+POSTING_OFFSETS_FILE = "bm25_offsets.npy"
+POSTING_DOC_IDS_FILE = "bm25_doc_ids.npy"
+POSTING_TERM_FREQS_FILE = "bm25_term_freqs.npy"
+DOC_LENGTHS_FILE = "bm25_doc_lengths.npy"
+
+# identifiers such as `max_tokens` or `HTTP_404` are kept as one token
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def save_sparse_index(folder: str, texts: List[str]) -> None:
+    """Build the inverted index of `texts` and persist it."""
+    os.makedirs(folder, exist_ok=True)
+    postings: dict[str, list[tuple[int, int]]] = {}
+    doc_lengths = np.zeros(len(texts), dtype=np.int32)
+    for doc_id, text in enumerate(texts):
+        tokens = tokenize(text)
+        doc_lengths[doc_id] = len(tokens)
+        for term, freq in Counter(tokens).items():
+            postings.setdefault(term, []).append((doc_id, freq))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(postings[term]) for term in terms], out=offsets[1:])
+    doc_ids = np.empty(offsets[-1], dtype=np.int32)
+    term_freqs = np.empty(offsets[-1], dtype=np.uint16)
+    for t, term in enumerate(terms):
+        ids, freqs = zip(*postings[term])
+        doc_ids[offsets[t] : offsets[t + 1]] = ids
+        term_freqs[offsets[t] : offsets[t + 1]] = np.minimum(freqs, 2**16 - 1)
+
+    with open(os.path.join(folder, TERMS_FILE), "w") as f:
+        json.dump(terms, f)
+    np.save(os.path.join(folder, POSTING_OFFSETS_FILE), offsets)
+    np.save(os.path.join(folder, POSTING_DOC_IDS_FILE), doc_ids)
+    np.save(os.path.join(folder, POSTING_TERM_FREQS_FILE), term_freqs)
+    np.save(os.path.join(folder, DOC_LENGTHS_FILE), doc_lengths)
+
+
+class SparseIndex:
+    """BM25 search over an index written by `save_sparse_index`."""
+
+    def __init__(self, folder: str, k1: float = 1.2, b: float = 0.75) -> None:
+        with open(os.path.join(folder, TERMS_FILE)) as f:
+            self.term_ids = {term: t for t, term in enumerate(json.load(f))}
+        self.offsets = np.load(os.path.join(folder, POSTING_OFFSETS_FILE))
+        self.doc_ids = np.load(
+            os.path.join(folder, POSTING_DOC_IDS_FILE), mmap_mode="r"
+        )
+        self.term_freqs = np.load(
+            os.path.join(folder, POSTING_TERM_FREQS_FILE), mmap_mode="r"
+        )
+        doc_lengths = np.load(os.path.join(folder, DOC_LENGTHS_FILE))
+        self.k1 = k1
+        self.ntotal = len(doc_lengths)
+        # length normalisation of each document, precomputed once
+        self.norms = (
+            k1 * (1 - b + b * doc_lengths / max(float(doc_lengths.mean()), 1.0))
+        ).astype(np.float32)
+
+    def idf(self, document_frequency: int) -> float:
+        return math.log(
+            1 + (self.ntotal - document_frequency + 0.5) / (document_frequency + 0.5)
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for a query."""
+        scores = np.zeros(self.ntotal, dtype=np.float32)
+        for term in dict.fromkeys(tokenize(query)):
+            t = self.term_ids.get(term)
+            if t is None:
+                continue
+            start, end = self.offsets[t], self.offsets[t + 1]
+            doc_ids = self.doc_ids[start:end]
+            freqs = self.term_freqs[start:end].astype(np.float32)
+            scores[doc_ids] += (
+                self.idf(end - start)
+                * freqs
+                * (self.k1 + 1)
+                / (freqs + self.norms[doc_ids])
+            )
+        return scores
+
+    def search(self, queries: List[str], k: int) -> List[np.ndarray]:
+        """Rows of the `k` best matching documents of each query, best first."""
+        results = []
+        for query in queries:
+            scores = self.scores(query)
+            k_query = min(k, int(np.count_nonzero(scores)))
+            if k_query == 0:
+                results.append(np.empty(0, dtype=np.int64))
+                continue
+            top = np.argpartition(-scores, k_query - 1)[:k_query]
+            results.append(top[np.argsort(-scores[top], kind="stable")])
+        return results
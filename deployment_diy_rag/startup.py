@@ -0,0 +1,109 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from __future__ import annotations
+
+import json
+import logging
+import os
+import resource
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List
+
+from event_loop import run_sync
+from retrieval import embed_queries, get_documents
+
+if TYPE_CHECKING:
+    from docsassist.schema import WarmupSettings
+    from utils import RAGModel
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, or its peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoadReport:
+    """Wall time and RSS growth of each stage of model loading."""
+
+    def __init__(self) -> None:
+        self.components: List[Dict[str, Any]] = []
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, component: str) -> Iterator[None]:
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            rss_after = current_rss_bytes()
+            self.components.append(
+                {
+                    "component": component,
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "rss_mb": round(rss_after / 2**20, 1),
+                    "rss_delta_mb": round((rss_after - rss_before) / 2**20, 1),
+                }
+            )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_seconds": round(time.perf_counter() - self._start, 3),
+            "rss_mb": round(current_rss_bytes() / 2**20, 1),
+            "components": self.components,
+        }
+
+    def log(self) -> None:
+        logger.info("DIY RAG model load report: %s", json.dumps(self.as_dict()))
+
+
+def warmup(model: RAGModel, settings: WarmupSettings, report: LoadReport) -> None:
+    """
+    Run synthetic queries through each stage so the first request does not
+    pay for lazy initialisation.
+
+    Bypasses the retrieval cache, so the synthetic queries are not cached.
+    """
+    vectorstore = model.retriever.vectorstore
+    with report.stage("warmup_embedding"):
+        vectors = embed_queries(vectorstore, settings.queries)
+    with report.stage("warmup_index"):
+        documents = [
+            get_documents(vectorstore, document_ids)
+            for document_ids in model.retriever.search_ids(settings.queries, vectors)
+        ]
+    if model.reranker is not None:
+        with report.stage("warmup_rerank"):
+            model.reranker.rerank(settings.queries, documents)
+
+    if not settings.include_llm:
+        return
+    with report.stage("warmup_llm"):
+        try:
+            run_sync(
+                model.question_answer_chain.ainvoke(
+                    {"input": settings.queries[0], "chat_history": [], "context": []}
+                )
+            )
+        except Exception:
+            # an LLM outage should not keep the replica from starting
+            logger.warning("LLM warmup request failed", exc_info=True)
@@ -15,16 +15,25 @@ from __future__ import annotations
 
 import json
 import time
-import traceback
 from dataclasses import dataclass
-from typing import Any, Dict, List, Union
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Union
 
 from langchain.schema import AIMessage, BaseMessage, HumanMessage
 from langchain.schema.runnable import Runnable
-from langchain_community.callbacks import get_openai_callback
 from langchain_core.documents import Document
-from openai.types.chat import ChatCompletion
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from openai.types.chat.chat_completion import Choice
+from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
+from openai.types.chat.chat_completion_chunk import ChoiceDelta
+
+from metrics import LLMCallMetrics
+
+if TYPE_CHECKING:
+    from caching import ResponseCache, SemanticCache
+    from docsassist.schema import RAGModelSettings
+    from metrics import RequestMetrics
+    from reranking import CrossEncoderReranker
+    from retrieval import CachedVectorStoreRetriever
 
 
 @dataclass
@@ -34,11 +43,25 @@ class CitationInfo:
     page: str
 
 
+@dataclass
+class RAGModel:
+    settings: RAGModelSettings
+    retriever: CachedVectorStoreRetriever
+    question_rewriter: Runnable[dict[str, Any], str]
+    question_answer_chain: Runnable[dict[str, Any], str]
+    streaming_answer_chain: Runnable[dict[str, Any], str]
+    semantic_cache: SemanticCache | None = None
+    response_cache: ResponseCache | None = None
+    reranker: CrossEncoderReranker | None = None
+    load_report: dict[str, Any] | None = None
+
+
 def create_chat_completion(
     response: str,
     model_name: str,
     citations: list[Document],
     created_time: int | None = None,
+    metrics: RequestMetrics | None = None,
 ) -> ChatCompletion:
     """Convert LangChain response to OpenAI ChatCompletion format"""
     if created_time is None:
@@ -59,7 +82,16 @@ def create_chat_completion(
         system_fingerprint=None,
     )
 
-    citations_dr = [
+    completion.citations = format_citations(citations)  # type: ignore[attr-defined]
+    if metrics is not None:
+        completion.usage = metrics.usage()
+        completion.timings = metrics.timings  # type: ignore[attr-defined]
+    return completion
+
+
+def format_citations(citations: list[Document]) -> list[dict[str, Any]]:
+    """Convert retrieved documents to the citation format expected by DataRobot."""
+    return [
         {
             "content": c.page_content,
             "link": c.metadata["source"],
@@ -68,8 +100,38 @@ def create_chat_completion(
         for c in citations
     ]
 
-    completion.citations = citations_dr  # type: ignore[attr-defined]
-    return completion
+
+def create_chat_completion_chunk(
+    completion_id: str,
+    model_name: str,
+    created_time: int,
+    content: str | None = None,
+    role: str | None = None,
+    finish_reason: str | None = None,
+    citations: list[Document] | None = None,
+    metrics: RequestMetrics | None = None,
+) -> ChatCompletionChunk:
+    """Build one OpenAI ChatCompletionChunk of a streamed response"""
+    chunk = ChatCompletionChunk(
+        id=completion_id,
+        choices=[
+            ChunkChoice(
+                index=0,
+                delta=ChoiceDelta(role=role, content=content),
+                finish_reason=finish_reason,
+            )
+        ],
+        created=created_time,
+        model=model_name,
+        object="chat.completion.chunk",
+        system_fingerprint=None,
+        usage=metrics.usage() if metrics is not None else None,
+    )
+    if citations is not None:
+        chunk.citations = format_citations(citations)  # type: ignore[attr-defined]
+    if metrics is not None:
+        chunk.timings = metrics.timings  # type: ignore[attr-defined]
+    return chunk
 
 
 def convert_messages_to_chat_history(
@@ -94,36 +156,48 @@ def convert_messages_to_chat_history(
 
 
 def merge_result_dicts(results: list[dict[str, list[Any]]]) -> dict[str, list[Any]]:
-    """Merge multiple result dictionaries into one."""
+    """Merge multiple result dictionaries into one.
+
+    Rows may not share the same columns (e.g. a failed row has no citations),
+    so missing values are padded with None to keep every column aligned.
+    """
     final_result: dict[str, list[Any]] = {}
 
-    for result in results:
+    for n_rows, result in enumerate(results):
         for key, values in result.items():
             if key not in final_result:
-                final_result[key] = []
+                final_result[key] = [None] * n_rows
             final_result[key].extend(values)
+        for key, values in final_result.items():
+            if key not in result:
+                values.append(None)
 
     return final_result
 
 
 def create_result_dict(
-    answer: str, citations: list[CitationInfo], target_column_name: str
-) -> dict[str, list[str]]:
-    """Create the result dictionary with answer and citations."""
-    result = {target_column_name: [answer]}
+    answer: str,
+    citations: list[CitationInfo],
+    target_column_name: str,
+    metrics: RequestMetrics | None = None,
+) -> dict[str, list[Any]]:
+    """Create the result dictionary with answer, citations and request metrics."""
+    result: dict[str, list[Any]] = {target_column_name: [answer]}
 
     for i, citation in enumerate(citations):
         result[f"CITATION_CONTENT_{i}"] = [citation.content]
         result[f"CITATION_SOURCE_{i}"] = [citation.source]
         result[f"CITATION_PAGE_{i}"] = [citation.page]
 
+    if metrics is not None:
+        result.update(metrics.as_columns())
     return result
 
 
-def process_citations(chain_output: Dict[str, Any]) -> List[CitationInfo]:
-    """Extract citation information from chain output."""
+def process_citations(documents: List[Document]) -> List[CitationInfo]:
+    """Extract citation information from retrieved documents."""
     citations = []
-    for doc in chain_output.get("context", []):
+    for doc in documents:
         citations.append(
             CitationInfo(
                 content=doc.page_content,
@@ -134,31 +208,51 @@ def process_citations(chain_output: Dict[str, Any]) -> List[CitationInfo]:
     return citations
 
 
-def process_single_row(
+async def aanswer_question(
     question: str,
     chat_history: List[BaseMessage],
-    chain: Runnable[dict[str, Any], Any],
-    target_column_name: str,
-) -> dict[str, list[Any]]:
-    """Process a single row of data."""
-    try:
-        with get_openai_callback():
-            chain_output = chain.invoke(
-                {
-                    "input": question,
-                    "chat_history": chat_history,
-                }
-            )
+    context: List[Document],
+    chain: Runnable[dict[str, Any], str],
+    metrics: RequestMetrics,
+) -> str:
+    """Answer a question from its already retrieved context."""
+    calls = LLMCallMetrics()
+    answer = await chain.ainvoke(
+        {
+            "input": question,
+            "chat_history": chat_history,
+            "context": context,
+        },
+        config={"callbacks": [calls]},
+    )
+    metrics.add_answer(calls)
+    return answer
+
+
+async def astream_answer(
+    question: str,
+    chat_history: List[BaseMessage],
+    context: List[Document],
+    chain: Runnable[dict[str, Any], str],
+    metrics: RequestMetrics,
+) -> AsyncIterator[str]:
+    """Stream the answer to a question from its already retrieved context."""
+    calls = LLMCallMetrics()
+    async for token in chain.astream(
+        {
+            "input": question,
+            "chat_history": chat_history,
+            "context": context,
+        },
+        config={"callbacks": [calls]},
+    ):
+        yield token
+    metrics.add_answer(calls)
 
-        citations = process_citations(chain_output)
-        return create_result_dict(
-            answer=chain_output["answer"],
-            citations=citations,
-            target_column_name=target_column_name,
-        )
 
-    except Exception:
-        return {target_column_name: [traceback.format_exc()]}
+def history_key(chat_history: List[BaseMessage]) -> tuple[tuple[str, str], ...]:
+    """Hashable representation of a chat history, used to deduplicate rows."""
+    return tuple((str(msg.type), str(msg.content)) for msg in chat_history)
 
 
 def parse_chat_history(messages_json: str) -> List[BaseMessage]:
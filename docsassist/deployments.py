@@ -14,9 +14,17 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
+import logging
+import os
+import pathlib
+import re
 import subprocess
-from typing import Any, Dict, Mapping, Tuple, Type, Union
+import tempfile
+import threading
+import time
+from typing import Any, ClassVar, Dict, Mapping, Optional, Tuple, Type, Union
 
 from pydantic import AliasChoices, Field
 from pydantic_settings import (
@@ -27,18 +35,110 @@ from pydantic_settings import (
 )
 from pydantic_settings.sources import parse_env_vars
 
+logger = logging.getLogger(__name__)
+
+RUNTIME_PARAM_PREFIX = "MLOPS_RUNTIME_PARAM_"
+
+# seconds stack outputs are reused from disk across processes, 0 to disable
+PULUMI_OUTPUTS_CACHE_TTL_ENV = "PULUMI_OUTPUTS_CACHE_TTL"
+PULUMI_OUTPUTS_CACHE_DIR = os.path.join(
+    tempfile.gettempdir(), "docsassist-pulumi-outputs"
+)
+
+
+def _runtime_params_present(settings_cls: Type[BaseSettings]) -> bool:
+    """Whether DataRobot runtime parameters provide every field of the settings."""
+    for name, field in settings_cls.model_fields.items():
+        alias = field.validation_alias
+        choices = alias.choices if isinstance(alias, AliasChoices) else [alias or name]
+        if not any(
+            isinstance(choice, str)
+            and choice.startswith(RUNTIME_PARAM_PREFIX)
+            and choice in os.environ
+            for choice in choices
+        ):
+            return False
+    return bool(settings_cls.model_fields)
+
+
+def _find_pulumi_project() -> Optional[pathlib.Path]:
+    """Pulumi.yaml found the way the CLI does, from the working directory up."""
+    cwd = pathlib.Path.cwd()
+    for folder in (cwd, *cwd.parents):
+        project_file = folder / "Pulumi.yaml"
+        if project_file.is_file():
+            return project_file
+    return None
+
+
+def selected_stack_name(project_file: pathlib.Path) -> Optional[str]:
+    """Stack selected with `pulumi stack select`, read from the Pulumi workspace."""
+    match = re.search(
+        r"^name:\s*['\"]?([^'\"\s]+)", project_file.read_text(), re.MULTILINE
+    )
+    if match is None:
+        return None
+    pulumi_home = os.environ.get("PULUMI_HOME") or os.path.join(
+        os.path.expanduser("~"), ".pulumi"
+    )
+    project_hash = hashlib.sha1(str(project_file).encode()).hexdigest()
+    workspace_file = os.path.join(
+        pulumi_home, "workspaces", f"{match.group(1)}-{project_hash}-workspace.json"
+    )
+    try:
+        with open(workspace_file) as f:
+            return json.load(f).get("stack") or None
+    except (OSError, ValueError):
+        return None
+
+
+def pulumi_outputs_cache_path(project_file: pathlib.Path, stack: str) -> str:
+    project_hash = hashlib.sha1(str(project_file).encode()).hexdigest()[:12]
+    return os.path.join(
+        PULUMI_OUTPUTS_CACHE_DIR,
+        f"{project_hash}-{re.sub(r'[^A-Za-z0-9_.-]', '_', stack)}.json",
+    )
+
+
+def clear_pulumi_outputs_cache(stack: str) -> None:
+    """Drop the cached outputs of a stack, e.g. before `pulumi up` changes them."""
+    project_file = _find_pulumi_project()
+    if project_file is None:
+        return
+    try:
+        os.remove(pulumi_outputs_cache_path(project_file, stack))
+    except FileNotFoundError:
+        pass
+    PulumiSettingsSource._PULUMI_OUTPUTS = None
+
 
 class PulumiSettingsSource(EnvSettingsSource):
-    """Pulumi stack outputs as a pydantic settings source."""
+    """
+    Pulumi stack outputs as a pydantic settings source.
 
-    _PULUMI_OUTPUTS: Dict[str, str] = {}
-    _PULUMI_CALLED: bool = False
+    The outputs are read once per process, and reused across processes for
+    `PULUMI_OUTPUTS_CACHE_TTL` seconds when set. Pulumi is not called at all
+    when runtime parameters provide every field, as inside DataRobot.
+    """
 
-    def __init__(self, *args: Any, **kwargs: Any) -> None:
-        self.read_pulumi_outputs()
-        super().__init__(*args, **kwargs)
+    _PULUMI_OUTPUTS: ClassVar[Optional[Dict[str, str]]] = None
+    _LOCK: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, settings_cls: Type[BaseSettings], *args: Any, **kwargs: Any):
+        self.outputs = (
+            {} if _runtime_params_present(settings_cls) else self.read_pulumi_outputs()
+        )
+        super().__init__(settings_cls, *args, **kwargs)
 
-    def read_pulumi_outputs(self) -> None:
+    @classmethod
+    def read_pulumi_outputs(cls) -> Dict[str, str]:
+        with cls._LOCK:
+            if cls._PULUMI_OUTPUTS is None:
+                cls._PULUMI_OUTPUTS = cls._read_cached_pulumi_outputs()
+            return cls._PULUMI_OUTPUTS
+
+    @staticmethod
+    def _run_pulumi_stack_output() -> Dict[str, str]:
         try:
             raw_outputs = json.loads(
                 subprocess.check_output(
@@ -47,16 +147,48 @@ class PulumiSettingsSource(EnvSettingsSource):
                     stderr=subprocess.STDOUT,
                 ).strip()
             )
-            self._PULUMI_OUTPUTS = {
-                k: v if isinstance(v, str) else json.dumps(v)
-                for k, v in raw_outputs.items()
-            }
         except BaseException:
-            self._PULUMI_OUTPUTS = {}
+            return {}
+        return {
+            k: v if isinstance(v, str) else json.dumps(v)
+            for k, v in raw_outputs.items()
+        }
+
+    @classmethod
+    def _read_cached_pulumi_outputs(cls) -> Dict[str, str]:
+        ttl = float(os.environ.get(PULUMI_OUTPUTS_CACHE_TTL_ENV) or 0)
+        project_file = _find_pulumi_project() if ttl > 0 else None
+        stack = selected_stack_name(project_file) if project_file else None
+        if project_file is None or stack is None:
+            return cls._run_pulumi_stack_output()
+
+        cache_path = pulumi_outputs_cache_path(project_file, stack)
+        try:
+            if time.time() - os.path.getmtime(cache_path) < ttl:
+                with open(cache_path) as f:
+                    cached = json.load(f)
+                if isinstance(cached, dict):
+                    return {str(k): str(v) for k, v in cached.items()}
+        except (OSError, ValueError):
+            pass
+
+        outputs = cls._run_pulumi_stack_output()
+        if outputs:
+            # written atomically, other processes may be reading it
+            try:
+                os.makedirs(PULUMI_OUTPUTS_CACHE_DIR, exist_ok=True)
+                with tempfile.NamedTemporaryFile(
+                    "w", dir=PULUMI_OUTPUTS_CACHE_DIR, delete=False
+                ) as tmp_file:
+                    json.dump(outputs, tmp_file)
+                os.replace(tmp_file.name, cache_path)
+            except OSError:
+                logger.warning("Could not cache pulumi stack outputs", exc_info=True)
+        return outputs
 
     def _load_env_vars(self) -> Mapping[str, Union[str, None]]:
         return parse_env_vars(
-            self._PULUMI_OUTPUTS,
+            self.outputs,
             self.case_sensitive,
             self.env_ignore_empty,
             self.env_parse_none_str,
@@ -14,13 +14,15 @@
 
 from __future__ import annotations
 
+import functools
 import gettext as gettext_module
+import hashlib
+import json
 import os
 from enum import Enum
 from gettext import GNUTranslations, NullTranslations
-from typing import Union
+from typing import Any, Dict, Union
 
-from babel.messages import mofile, pofile
 from pydantic import AliasChoices, Field
 from pydantic_settings import BaseSettings
 
@@ -37,22 +39,62 @@ APP_LOCALE: LanguageCode = LanguageCode.EN
 app_locale_env_name: str = "APP_LOCALE"
 
 
-def compile_mo_from_po(locale_folder_path: str) -> None:
+def _read_stamp(stamp_file_path: str) -> Dict[str, Any]:
+    try:
+        with open(stamp_file_path, "r", encoding="utf-8") as stamp_file:
+            return dict(json.load(stamp_file))
+    except (OSError, ValueError):
+        return {}
+
+
+def compile_mo_from_po(locale_folder_path: str, force: bool = False) -> bool:
     """
-    Compile a .po file to a .mo file.
+    Compile a .po file to a .mo file, unless the .po file is unchanged since
+    the last compilation.
+
+    The .po file counts as unchanged if its mtime and size match those recorded
+    next to the .mo file, or else if its content hash does.
     :param locale_folder_path: Path to the parent locale folder.
+    :param force: Compile even if the .po file is unchanged.
+    :return: Whether the .mo file was written.
     """
 
     mo_file_path = os.path.join(locale_folder_path, "base.mo")
     po_file_path = os.path.join(locale_folder_path, "base.po")
+    stamp_file_path = os.path.join(locale_folder_path, "base.mo.stamp")
 
     if not os.path.exists(po_file_path):
         raise ValueError(f"Invalid locale file: {po_file_path}")
 
-    with open(po_file_path, "r", encoding="utf-8") as po_file:
-        catalog = pofile.read_po(po_file)
-    with open(mo_file_path, "wb") as mo_file:
-        mofile.write_mo(mo_file, catalog)
+    po_stat = os.stat(po_file_path)
+    stamp = _read_stamp(stamp_file_path) if os.path.exists(mo_file_path) else {}
+    if (
+        not force
+        and stamp.get("po_mtime_ns") == po_stat.st_mtime_ns
+        and stamp.get("po_size") == po_stat.st_size
+    ):
+        return False
+
+    with open(po_file_path, "rb") as po_file:
+        po_content = po_file.read()
+    new_stamp = {
+        "po_mtime_ns": po_stat.st_mtime_ns,
+        "po_size": po_stat.st_size,
+        "po_sha256": hashlib.sha256(po_content).hexdigest(),
+    }
+    compiled = force or stamp.get("po_sha256") != new_stamp["po_sha256"]
+    if compiled:
+        # Babel is only imported when a catalog actually needs compiling
+        from babel.messages import mofile, pofile
+
+        with open(po_file_path, "r", encoding="utf-8") as po_file:
+            catalog = pofile.read_po(po_file)
+        with open(mo_file_path, "wb") as mo_file:
+            mofile.write_mo(mo_file, catalog)
+        clear_translation_cache()
+    with open(stamp_file_path, "w", encoding="utf-8") as stamp_file:
+        json.dump(new_stamp, stamp_file)
+    return compiled
 
 
 class LocaleSettings(BaseSettings):
@@ -84,17 +126,34 @@ class LocaleSettings(BaseSettings):
         return os.path.abspath(os.path.join(base_dir, "locale"))
 
 
+@functools.lru_cache(maxsize=1)
+def get_app_locale() -> str:
+    """Locale set in the environment, read once until the cache is cleared"""
+    return LocaleSettings().app_locale
+
+
+@functools.lru_cache(maxsize=None)
+def get_locale_translation(locale: str) -> Union[NullTranslations, GNUTranslations]:
+    """Return the Translations instance of a locale, loaded once per process"""
+    if locale == LanguageCode.EN:
+        return gettext_module.NullTranslations()
+    return gettext_module.translation(
+        "base",
+        localedir=LocaleSettings().get_locale_dir(),
+        languages=[locale],
+        fallback=True,
+    )
+
+
+def clear_translation_cache() -> None:
+    """Re-read the locale and the translations on the next lookup"""
+    get_app_locale.cache_clear()
+    get_locale_translation.cache_clear()
+
+
 def get_translation_ctx() -> Union[NullTranslations, GNUTranslations]:
     """Return a Translations instance based on the locale set in the environment"""
-    if LocaleSettings().app_locale == LanguageCode.EN:
-        return gettext_module.NullTranslations()
-    else:
-        return gettext_module.translation(
-            "base",
-            localedir=LocaleSettings().get_locale_dir(),
-            languages=[LocaleSettings().app_locale],
-            fallback=True,
-        )
+    return get_locale_translation(get_app_locale())
 
 
 def gettext_noop(message: str) -> str:
@@ -12,35 +12,64 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from __future__ import annotations
+
+import asyncio
+import functools
+import importlib.util
 import logging
+import threading
 from dataclasses import dataclass
-
-import datarobot as dr
-from datarobot.models.deployment.deployment import Deployment
-from openai import OpenAI
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
-from openai.types.chat.chat_completion_user_message_param import (
-    ChatCompletionUserMessageParam,
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
 )
-from pydantic import ValidationError
 
-from docsassist.deployments import RAGDeployment  # noqa: E402
-from docsassist.schema import (  # noqa: E402
+from docsassist.deployments import RAGDeployment
+from docsassist.schema import (
+    RAGClientSettings,
     RAGOutput,
+    Reference,
 )
 
+# datarobot, openai and httpx are imported on first use, so the frontend
+# renders before they are loaded
+if TYPE_CHECKING:
+    import httpx
+    from datarobot.models.deployment.deployment import Deployment
+    from openai import AsyncOpenAI, OpenAI
+    from openai.types import CompletionUsage
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
 logger = logging.getLogger(__name__)
 
-try:
-    rag_deployment_id = RAGDeployment().id
-except ValidationError as e:
-    raise ValueError(
-        (
-            "Unable to load DataRobot deployment ids. If running locally, verify you have selected "
-            "the correct stack and that it is active using `pulumi stack output`. "
-            "If running in DataRobot, verify your runtime parameters have been set correctly."
-        )
-    ) from e
+
+@functools.lru_cache(maxsize=None)
+def get_rag_deployment_id() -> str:
+    """Id of the RAG deployment, resolved on the first question."""
+    from pydantic import ValidationError
+
+    try:
+        return RAGDeployment().id
+    except ValidationError as e:
+        raise ValueError(
+            (
+                "Unable to load DataRobot deployment ids. If running locally, verify you have selected "
+                "the correct stack and that it is active using `pulumi stack output`. "
+                "If running in DataRobot, verify your runtime parameters have been set correctly."
+            )
+        ) from e
 
 
 @dataclass
@@ -49,26 +78,260 @@ class DeploymentInfo:
     target_name: str
 
 
+def _http_client_options() -> Dict[str, Any]:
+    import httpx
+
+    settings = RAGClientSettings()
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.max_connections,
+            max_keepalive_connections=settings.max_keepalive_connections,
+            keepalive_expiry=settings.keepalive_expiry,
+        ),
+        "http2": settings.http2 and importlib.util.find_spec("h2") is not None,
+    }
+
+
+def _openai_client_options(
+    endpoint: str, deployment_id: str, token: str
+) -> Dict[str, Any]:
+    import httpx
+
+    settings = RAGClientSettings()
+    return {
+        "base_url": endpoint + f"/deployments/{deployment_id}",
+        "api_key": token,
+        "timeout": httpx.Timeout(settings.timeout, connect=settings.connect_timeout),
+        "max_retries": settings.max_retries,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _get_http_client() -> httpx.Client:
+    """Connection pool shared by all clients of the process."""
+    from openai import DefaultHttpxClient
+
+    return DefaultHttpxClient(**_http_client_options())
+
+
+@functools.lru_cache(maxsize=32)
+def get_openai_client(endpoint: str, deployment_id: str, token: str) -> OpenAI:
+    """
+    OpenAI client of a deployment, reused across questions and sessions.
+
+    Clients share one keep-alive connection pool, so a question does not pay
+    for a new TCP and TLS handshake.
+    """
+    from openai import OpenAI
+
+    return OpenAI(
+        **_openai_client_options(endpoint, deployment_id, token),
+        http_client=_get_http_client(),
+    )
+
+
+@dataclass
+class _LoopClients:
+    """Async clients of one event loop, which owns their connections."""
+
+    http_client: httpx.AsyncClient
+    openai_clients: Dict[tuple[str, str, str], AsyncOpenAI]
+    closer: Optional[asyncio.Task[None]] = None
+
+
+_async_clients: Dict[asyncio.AbstractEventLoop, _LoopClients] = {}
+_async_clients_lock = threading.Lock()
+
+
+async def _close_on_shutdown(http_client: httpx.AsyncClient) -> None:
+    """Close the connection pool once the event loop cancels its tasks."""
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await http_client.aclose()
+
+
+def get_async_openai_client(
+    endpoint: str, deployment_id: str, token: str
+) -> AsyncOpenAI:
+    """
+    AsyncOpenAI client of a deployment for the running event loop.
+
+    Clients of one event loop share a keep-alive connection pool, which is
+    closed while the loop shuts down and cancels its remaining tasks, as
+    `asyncio.run` does. Clients of closed event loops are dropped.
+    """
+    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+    loop = asyncio.get_running_loop()
+    key = (endpoint, deployment_id, token)
+    with _async_clients_lock:
+        for closed in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[closed]
+        loop_clients = _async_clients.get(loop)
+        if loop_clients is None:
+            loop_clients = _async_clients[loop] = _LoopClients(
+                DefaultAsyncHttpxClient(**_http_client_options()), {}
+            )
+            loop_clients.closer = loop.create_task(
+                _close_on_shutdown(loop_clients.http_client)
+            )
+        if key not in loop_clients.openai_clients:
+            loop_clients.openai_clients[key] = AsyncOpenAI(
+                **_openai_client_options(endpoint, deployment_id, token),
+                http_client=loop_clients.http_client,
+            )
+        return loop_clients.openai_clients[key]
+
+
+def _request_messages(
+    question: str, messages: list[ChatCompletionMessageParam]
+) -> list[ChatCompletionMessageParam]:
+    from openai.types.chat.chat_completion_user_message_param import (
+        ChatCompletionUserMessageParam,
+    )
+
+    return messages + [ChatCompletionUserMessageParam(content=question, role="user")]
+
+
+def _usage(
+    usage: Optional[CompletionUsage], timings: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    if usage is None and not timings:
+        return None
+    # no token counts when the deployment could not report them
+    result = usage.model_dump(exclude_none=True) if usage is not None else {}
+    # per-stage latency in milliseconds, reported by the DIY RAG deployment
+    for stage, ms in (timings or {}).items():
+        result[f"{stage}_ms"] = ms
+    return result
+
+
+def _to_rag_output(response: ChatCompletion, question: str) -> RAGOutput:
+    return RAGOutput(
+        completion=str(response.choices[0].message.content),
+        references=response.citations,  # type: ignore[attr-defined]
+        usage=_usage(response.usage, getattr(response, "timings", None)),
+        question=question,
+    )
+
+
+class _StreamAccumulator:
+    """Collects the answer, citations and usage of a streamed completion."""
+
+    def __init__(
+        self,
+        question: str,
+        on_references: Optional[Callable[[List[Reference]], None]] = None,
+    ) -> None:
+        self.question = question
+        self.on_references = on_references
+        self.parts: list[str] = []
+        self.citations: list[Any] = []
+        self.usage: Optional[CompletionUsage] = None
+        self.timings: Optional[Dict[str, Any]] = None
+
+    def add(self, chunk: ChatCompletionChunk) -> str:
+        """Record a chunk and return its text delta."""
+        citations = getattr(chunk, "citations", None)
+        if citations is not None:
+            self.citations = citations
+            if self.on_references is not None:
+                self.on_references([Reference.model_validate(c) for c in citations])
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        self.timings = getattr(chunk, "timings", None) or self.timings
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            self.parts.append(delta)
+        return delta or ""
+
+    def output(self) -> RAGOutput:
+        return RAGOutput(
+            completion="".join(self.parts),
+            references=self.citations,
+            usage=_usage(self.usage, self.timings),
+            question=self.question,
+        )
+
+
+def _rag_client_args() -> tuple[str, str, str]:
+    import datarobot as dr
+
+    dr_client = dr.client.get_client()
+    return dr_client.endpoint, get_rag_deployment_id(), dr_client.token
+
+
 def get_rag_completion(
     question: str, messages: list[ChatCompletionMessageParam]
 ) -> RAGOutput:
     """Retrieve predictions from a DataRobot RAG deployment and DataRobot guard deployment"""
-    dr_client = dr.client.get_client()
-    openai_client = OpenAI(
-        base_url=dr_client.endpoint + f"/deployments/{rag_deployment_id}",
-        api_key=dr_client.token,
-    )
+    openai_client = get_openai_client(*_rag_client_args())
 
     response = openai_client.chat.completions.create(
         model="datarobot-deployed-llm",
-        messages=messages
-        + [ChatCompletionUserMessageParam(content=question, role="user")],
+        messages=_request_messages(question, messages),
     )
+    return _to_rag_output(response, question)
 
-    rag_output = RAGOutput(
-        completion=str(response.choices[0].message.content),
-        references=response.citations,  # type: ignore[attr-defined]
-        question=question,
+
+def stream_rag_completion(
+    question: str,
+    messages: list[ChatCompletionMessageParam],
+    on_references: Optional[Callable[[List[Reference]], None]] = None,
+) -> Iterator[Union[str, RAGOutput]]:
+    """Stream a RAG completion: text deltas as they arrive, then the full RAGOutput
+
+    `on_references` is called with the citations as soon as they arrive, which
+    the DIY RAG deployment sends before the first token.
+    """
+    openai_client = get_openai_client(*_rag_client_args())
+
+    accumulator = _StreamAccumulator(question, on_references)
+    stream: Iterable[ChatCompletionChunk] = openai_client.chat.completions.create(
+        model="datarobot-deployed-llm",
+        messages=_request_messages(question, messages),
+        stream=True,
     )
+    for chunk in stream:
+        delta = accumulator.add(chunk)
+        if delta:
+            yield delta
+    yield accumulator.output()
 
-    return rag_output
+
+async def aget_rag_completion(
+    question: str, messages: list[ChatCompletionMessageParam]
+) -> RAGOutput:
+    """Async counterpart of `get_rag_completion`, for concurrent requests"""
+    # may call `pulumi stack output`, so it is kept off the event loop
+    client_args = await asyncio.to_thread(_rag_client_args)
+    openai_client = get_async_openai_client(*client_args)
+
+    response = await openai_client.chat.completions.create(
+        model="datarobot-deployed-llm",
+        messages=_request_messages(question, messages),
+    )
+    return _to_rag_output(response, question)
+
+
+async def astream_rag_completion(
+    question: str,
+    messages: list[ChatCompletionMessageParam],
+    on_references: Optional[Callable[[List[Reference]], None]] = None,
+) -> AsyncIterator[Union[str, RAGOutput]]:
+    """Async counterpart of `stream_rag_completion`"""
+    client_args = await asyncio.to_thread(_rag_client_args)
+    openai_client = get_async_openai_client(*client_args)
+
+    accumulator = _StreamAccumulator(question, on_references)
+    stream = await openai_client.chat.completions.create(
+        model="datarobot-deployed-llm",
+        messages=_request_messages(question, messages),
+        stream=True,
+    )
+    async for chunk in stream:
+        delta = accumulator.add(chunk)
+        if delta:
+            yield delta
+    yield accumulator.output()
@@ -15,9 +15,8 @@
 from __future__ import annotations
 
 from enum import Enum
-from typing import Any, Dict, List, Optional, Tuple, Type
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Type
 
-import pandas as pd
 from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from pydantic import BaseModel, ConfigDict, Field
 from pydantic_settings import (
@@ -26,6 +25,9 @@ from pydantic_settings import (
     SettingsConfigDict,
 )
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 
 class RAGType(str, Enum):
     DIY = "diy"
@@ -37,6 +39,36 @@ class ApplicationType(str, Enum):
     DR = "dr"
 
 
+class EmbeddingBackend(str, Enum):
+    SENTENCE_TRANSFORMERS = "sentence_transformers"
+    ONNX = "onnx"
+    ONNX_INT8 = "onnx_int8"
+
+
+class IndexLoadMode(str, Enum):
+    IN_MEMORY = "in_memory"
+    MMAP = "mmap"
+
+
+class IndexType(str, Enum):
+    FLAT = "flat"
+    IVF = "ivf"
+    HNSW = "hnsw"
+    IVF_PQ = "ivf_pq"
+
+
+class SearchType(str, Enum):
+    SIMILARITY = "similarity"
+    MMR = "mmr"
+
+
+class VectorCompression(str, Enum):
+    NONE = "none"
+    FLOAT16 = "float16"
+    PCA = "pca"
+    BINARY = "binary"
+
+
 PROMPT_COLUMN_NAME: str = "promptText"
 TARGET_COLUMN_NAME: str = "resultText"
 
@@ -58,12 +90,186 @@ class DocumentModel(BaseModel):
     metadata: Dict[str, Any] = {}
 
 
+class SemanticCacheSettings(BaseModel):
+    """Answer cache for first-turn questions, matched by embedding similarity."""
+
+    enabled: bool = False
+    similarity_threshold: float = Field(default=0.95, gt=0.0, le=1.0)
+    ttl_seconds: int = Field(default=3600, gt=0)
+    max_entries: int = Field(default=1000, ge=1)
+    max_memory_mb: float = Field(default=64.0, gt=0.0)
+
+
+class ResponseCacheSettings(BaseModel):
+    """Exact-match answer cache shared by all workers on a node."""
+
+    enabled: bool = False
+    path: Optional[str] = Field(
+        default=None,
+        description="SQLite file backing the cache, defaults to a file per index "
+        "and settings version in the temp directory, replacing earlier versions",
+    )
+    max_entries: int = Field(default=10000, ge=1)
+
+
+class RetrievalCacheSettings(BaseModel):
+    """LRU cache of query embeddings and their top-k document ids."""
+
+    enabled: bool = True
+    max_entries: int = Field(default=4096, ge=1)
+
+
+class VectorCompressionSettings(BaseModel):
+    """Compressed first-pass search, re-ranked with the full-precision vectors."""
+
+    method: VectorCompression = VectorCompression.NONE
+    rerank_candidates: int = Field(
+        default=50,
+        ge=1,
+        description="Hits of the compressed search re-ranked at full precision",
+    )
+
+
+class RetrievalSettings(BaseModel):
+    """Number and selection of the chunks retrieved for a question."""
+
+    search_type: SearchType = SearchType.SIMILARITY
+    k: int = Field(default=4, ge=1)
+    fetch_k: int = Field(
+        default=20, ge=1, description="Candidates among which MMR selects k chunks"
+    )
+    lambda_mult: float = Field(
+        default=0.5,
+        ge=0.0,
+        le=1.0,
+        description="MMR trade-off, 1 for relevance only and 0 for diversity only",
+    )
+    score_threshold: Optional[float] = Field(
+        default=None,
+        ge=0.0,
+        le=1.0,
+        description="Minimum relevance score of a retrieved chunk",
+    )
+
+
+class HybridSearchSettings(BaseModel):
+    """BM25 keyword search fused with the dense search by reciprocal rank fusion."""
+
+    enabled: bool = False
+    candidates: int = Field(
+        default=20, ge=1, description="Hits of each search passed to the fusion"
+    )
+    dense_weight: float = Field(default=1.0, ge=0.0)
+    sparse_weight: float = Field(default=1.0, ge=0.0)
+    rrf_k: int = Field(
+        default=60,
+        ge=1,
+        description="Rank offset of the fusion, larger values flatten the weight of top ranks",
+    )
+    bm25_k1: float = Field(default=1.2, ge=0.0)
+    bm25_b: float = Field(default=0.75, ge=0.0, le=1.0)
+
+
+class RerankSettings(BaseModel):
+    """Cross-encoder re-ranking of the retrieved chunks before the QA prompt."""
+
+    model_config = ConfigDict(protected_namespaces=())
+
+    enabled: bool = False
+    model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    candidates: int = Field(
+        default=20, ge=1, description="Chunks retrieved and scored by the cross-encoder"
+    )
+    top_n: int = Field(
+        default=3, ge=1, description="Best scored chunks passed to the QA prompt"
+    )
+    batch_size: int = Field(default=32, ge=1)
+    time_budget_ms: Optional[float] = Field(
+        default=500.0,
+        gt=0.0,
+        description="Re-ranking is skipped when it would take longer, e.g. under load",
+    )
+    cache_max_entries: int = Field(default=10000, ge=0)
+
+
+class LLMRateLimitSettings(BaseModel):
+    """Client-side pacing and retries of the LLM calls of one worker process."""
+
+    requests_per_minute: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="Request quota of the process, unlimited if unset",
+    )
+    tokens_per_minute: Optional[int] = Field(
+        default=None,
+        ge=1,
+        description="Token quota of the process, counting prompt and completion tokens",
+    )
+    expected_completion_tokens: int = Field(
+        default=512,
+        ge=1,
+        description="Completion tokens counted for requests without max_tokens",
+    )
+    max_attempts: int = Field(
+        default=5, ge=1, description="Attempts of a request throttled with a 429"
+    )
+    initial_backoff_seconds: float = Field(default=1.0, gt=0.0)
+    max_backoff_seconds: float = Field(default=30.0, gt=0.0)
+
+
+class ContextPackingSettings(BaseModel):
+    """Assembly of the retrieved chunks into the context of the QA prompt."""
+
+    enabled: bool = True
+    merge_overlapping: bool = Field(
+        default=True,
+        description="Merge overlapping chunks of the same source into one passage",
+    )
+    max_tokens: int = Field(
+        default=3000,
+        ge=1,
+        description="Token budget of the retrieved context in the QA prompt",
+    )
+
+
+class WarmupSettings(BaseModel):
+    """Synthetic requests run by `load_model` before the model reports ready."""
+
+    enabled: bool = True
+    queries: List[str] = Field(
+        default=["How do I get started?", "What are the system requirements?"],
+        min_length=1,
+    )
+    include_llm: bool = Field(
+        default=False,
+        description="Also send one question to the LLM, which is billed",
+    )
+
+
 class RAGModelSettings(BaseModel):
     embedding_model_name: str
     max_retries: int
     request_timeout: int
     stuff_prompt: str
     temperature: float
+    max_concurrency: int = Field(default=4, ge=1)
+    embedding_backend: EmbeddingBackend = EmbeddingBackend.SENTENCE_TRANSFORMERS
+    index_load_mode: IndexLoadMode = IndexLoadMode.IN_MEMORY
+    index_type: IndexType = IndexType.FLAT
+    index_search_params: Dict[str, int] = Field(
+        default={},
+        description="faiss search time parameters, e.g. nprobe or efSearch",
+    )
+    vector_compression: VectorCompressionSettings = VectorCompressionSettings()
+    retrieval: RetrievalSettings = RetrievalSettings()
+    hybrid_search: HybridSearchSettings = HybridSearchSettings()
+    rerank: RerankSettings = RerankSettings()
+    context_packing: ContextPackingSettings = ContextPackingSettings()
+    warmup: WarmupSettings = WarmupSettings()
+    llm_rate_limit: LLMRateLimitSettings = LLMRateLimitSettings()
+    semantic_cache: SemanticCacheSettings = SemanticCacheSettings()
+    response_cache: ResponseCacheSettings = ResponseCacheSettings()
+    retrieval_cache: RetrievalCacheSettings = RetrievalCacheSettings()
 
     @classmethod
     def filename(cls) -> str:
@@ -79,6 +285,8 @@ class RAGOutput(BaseModel):
     question: Optional[str] = None
 
     def to_dataframe(self) -> pd.DataFrame:
+        import pandas as pd
+
         input_data = {
             "question": [self.question] if self.question else [""],
             "answer": [self.completion],
@@ -128,3 +336,26 @@ class CoreSettings(BaseSettings):
             env_settings,
             init_settings,
         )
+
+
+class RAGClientSettings(BaseSettings):
+    """HTTP connection pool of the frontend's requests to the RAG deployment.
+
+    Can be overridden by environment variables, e.g. RAG_CLIENT_MAX_CONNECTIONS.
+    """
+
+    max_connections: int = Field(default=20, ge=1)
+    max_keepalive_connections: int = Field(default=10, ge=0)
+    keepalive_expiry: float = Field(
+        default=60.0, ge=0.0, description="Seconds an idle connection is kept open"
+    )
+    connect_timeout: float = Field(default=10.0, gt=0.0)
+    timeout: float = Field(
+        default=120.0, gt=0.0, description="Seconds to wait for a completion"
+    )
+    max_retries: int = Field(default=2, ge=0)
+    http2: bool = Field(
+        default=True, description="Use HTTP/2 when the h2 package is installed"
+    )
+
+    model_config = SettingsConfigDict(env_prefix="RAG_CLIENT_", case_sensitive=False)
@@ -18,26 +18,27 @@ import base64
 import logging
 import os
 import sys
+from typing import TYPE_CHECKING, Iterator
 
-import datarobot as dr
 import streamlit as st
-from openai.types.chat.chat_completion_assistant_message_param import (
-    ChatCompletionAssistantMessageParam,
-)
-from openai.types.chat.chat_completion_user_message_param import (
-    ChatCompletionUserMessageParam,
-)
 from settings import app_settings
 from streamlit.delta_generator import DeltaGenerator
 from streamlit_theme import st_theme
 
 sys.path.append("../")
-from docsassist import predict
-from docsassist.i18n import gettext
+from docsassist.i18n import get_app_locale, gettext
 from docsassist.schema import (
     RAGOutput,
+    Reference,
 )
 
+# the DataRobot and OpenAI clients are loaded with the first question, so the
+# page renders without waiting for them
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import (
+        ChatCompletionMessageParam,
+    )
+
 logging.basicConfig(format="%(levelname)s:%(message)s", level=logging.INFO)
 
 
@@ -48,84 +49,171 @@ st.set_page_config(
     page_title=app_settings.page_title, page_icon="./datarobot_favicon.png"
 )
 
-with open("./style.css") as f:
-    css = f.read()
+# older messages are collapsed into an expander
+HISTORY_PAGE_SIZE = 20
+
 
-theme = st_theme()
-logo = "./DataRobot_white.svg"
-if theme and theme.get("base") == "light":
-    logo = "./DataRobot_black.svg"
+@st.cache_resource
+def load_static_assets() -> dict[str, str]:
+    """Stylesheet and logo images, read and encoded once per process."""
+    with open("./style.css") as f:
+        assets = {"css": f.read()}
+    for base, logo in (
+        ("dark", "./DataRobot_white.svg"),
+        ("light", "./DataRobot_black.svg"),
+    ):
+        with open(logo) as f:
+            b64 = base64.b64encode(f.read().encode("utf-8")).decode("utf-8")
+        assets[base] = r'<img src="data:image/svg+xml;base64,%s"/>' % b64
+    return assets
 
-with open(logo) as f:
-    svg = f.read()
 
-st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+@st.cache_resource
+def connect_datarobot() -> None:
+    """Configure the DataRobot client once for all sessions of the process."""
+    import datarobot as dr
 
-dr.Client(endpoint=DATAROBOT_ENDPOINT, token=DATAROBOT_API_KEY)
+    dr.Client(endpoint=DATAROBOT_ENDPOINT, token=DATAROBOT_API_KEY)
+
+
+assets = load_static_assets()
+
+# the theme is only detected once per session
+if st.session_state.get("theme") is None:
+    st.session_state.theme = st_theme()
+theme = st.session_state.theme
+logo_html = assets["light" if theme and theme.get("base") == "light" else "dark"]
+
+st.markdown(f"<style>{assets['css']}</style>", unsafe_allow_html=True)
 
 
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    messages: list[ChatCompletionMessageParam] = []
+    st.session_state.messages = messages
 
 if "response" not in st.session_state:
     st.session_state.response = {}
 
+if "rendered_messages" not in st.session_state:
+    st.session_state.rendered_messages = []
+
 
-def render_svg(svg: str) -> None:
-    """Renders the given svg string."""
-    b64 = base64.b64encode(svg.encode("utf-8")).decode("utf-8")
-    html = r'<img src="data:image/svg+xml;base64,%s"/>' % b64
+def render_svg(html: str) -> None:
+    """Renders the given svg image tag."""
     st.write(html, unsafe_allow_html=True)
 
 
-def render_message(
-    container: DeltaGenerator, message: str, is_user: bool = False
-) -> None:
+def message_html(message: str, is_user: bool = False) -> str:
     message_role = "user" if is_user else "ai"
     message_label = gettext("User") if is_user else gettext("Assistant")
-    container.markdown(
-        f"""
+    return f"""
     <div class="chat-message {message_role}-message">
         <div class="message-content">
             <span class="message-label"><b>{message_label}:</b></span>
             <span class="message-text">{message}</span>
         </div>
     </div>
-    """,
-        unsafe_allow_html=True,
-    )
+    """
+
+
+def render_message(
+    container: DeltaGenerator, message: str, is_user: bool = False
+) -> None:
+    container.markdown(message_html(message, is_user), unsafe_allow_html=True)
+
 
+def message_text(message: ChatCompletionMessageParam) -> str:
+    # the conversation only holds text messages
+    content = message.get("content")
+    return content if isinstance(content, str) else ""
 
-def render_conversation_history(container: DeltaGenerator) -> None:
+
+def rendered_history(messages: list[ChatCompletionMessageParam]) -> list[str]:
+    """HTML of each message, built once per locale and kept in the session."""
+    locale = get_app_locale()
+    # the role labels are translated, so the HTML is rebuilt for a new locale
+    if st.session_state.get("rendered_locale") != locale:
+        st.session_state.rendered_messages = []
+        st.session_state.rendered_locale = locale
+    rendered: list[str] = st.session_state.rendered_messages
+    for message in messages[len(rendered) :]:
+        rendered.append(message_html(message_text(message), message["role"] == "user"))
+    return rendered[: len(messages)]
+
+
+def render_conversation_history(
+    container: DeltaGenerator, messages: list[ChatCompletionMessageParam]
+) -> None:
+    """Render the history as one element for the latest page of messages."""
     container.subheader(gettext("Conversation History"))
-    for message in st.session_state.messages[:-1]:  # Exclude the latest message
-        render_message(container, message["content"], message["role"] == "user")
+    rendered = rendered_history(messages)
+    older, latest = rendered[:-HISTORY_PAGE_SIZE], rendered[-HISTORY_PAGE_SIZE:]
+    if older:
+        with container.expander(gettext("Earlier messages ({0})").format(len(older))):
+            st.markdown("".join(older), unsafe_allow_html=True)
+    container.markdown("".join(latest), unsafe_allow_html=True)
     st.markdown("---")
 
 
-def render_answer_and_citations(container: DeltaGenerator, response: RAGOutput) -> None:
-    render_message(container, response.completion, is_user=False)
+def citation_markdown(index: int, reference: Reference) -> str:
+    lines = [
+        gettext("**Reference {0}:**").format(index + 1),
+        gettext("**Source:** {0}").format(reference.metadata["source"]),
+        gettext("**Content:**"),
+    ]
+    lines += [text for text in reference.content.split("\\n") if text.strip()]
+    return "\n\n".join(lines)
+
 
-    with st.expander(gettext("Show Citations")):
-        for i, doc in enumerate(response.references):
-            st.markdown(gettext("**Reference {0}:**").format(i + 1))
-            st.markdown(gettext("**Source:** {0}").format(doc.metadata["source"]))
-            st.markdown(gettext("**Content:**"))
-            for text in doc.content.split("\\n"):
-                if text.strip():
-                    st.markdown(text)
+def render_citations(container: DeltaGenerator, references: list[Reference]) -> None:
+    """Render each citation as a single element inside a collapsed expander."""
+    with container.expander(gettext("Show Citations")):
+        for i, reference in enumerate(references):
+            st.markdown(citation_markdown(i, reference))
             st.markdown("---")
 
 
+def render_answer_and_citations(container: DeltaGenerator, response: RAGOutput) -> None:
+    render_message(container, response.completion, is_user=False)
+    render_citations(container, response.references)
+
+
+def stream_answer_and_citations(container: DeltaGenerator, prompt: str) -> RAGOutput:
+    """Stream the answer into the page, showing citations as soon as they arrive."""
+    from docsassist import predict
+
+    connect_datarobot()
+    answer_placeholder = container.empty()
+    citations_placeholder = container.empty()
+    responses: list[RAGOutput] = []
+
+    def answer_deltas() -> Iterator[str]:
+        for item in predict.stream_rag_completion(
+            question=prompt,
+            messages=st.session_state.messages,
+            on_references=lambda references: render_citations(
+                citations_placeholder.container(), references
+            ),
+        ):
+            if isinstance(item, RAGOutput):
+                responses.append(item)
+            else:
+                yield item
+
+    with st.spinner(gettext("Getting AI response...")):
+        answer_placeholder.container().write_stream(answer_deltas())
+    response = responses[0]
+    # the streamed text is replaced by the styled message once complete
+    render_message(answer_placeholder, response.completion, is_user=False)
+    return response
+
+
 def main() -> None:
-    render_svg(svg)
+    render_svg(logo_html)
     st.title(app_settings.page_title)
 
     chat_container = st.container()
     prompt_container = st.container()
-    if st.session_state.messages:
-        render_conversation_history(chat_container)
-    answer_and_citations_placeholder = chat_container.container()
     if "prompt_sent" not in st.session_state:
         st.session_state.prompt_sent = False
     prompt = prompt_container.chat_input(
@@ -137,30 +225,31 @@ def main() -> None:
         args=None,
         kwargs=None,
     )
+    # a blank message does not start a new turn
+    if prompt is not None and not prompt.strip():
+        prompt = None
 
-    if prompt and prompt.strip():
-        st.session_state.prompt_sent = True
+    if st.session_state.messages:
+        # the latest answer is rendered with its citations below
+        render_conversation_history(
+            chat_container,
+            st.session_state.messages if prompt else st.session_state.messages[:-1],
+        )
+
+    if prompt:
         render_message(chat_container, prompt, True)
-        with st.spinner(gettext("Getting AI response...")):
-            response = predict.get_rag_completion(
-                question=prompt,
-                messages=st.session_state.messages,
-            )
+        response = stream_answer_and_citations(chat_container.container(), prompt)
+        st.session_state.prompt_sent = True
         st.session_state.response = response
         st.session_state.messages.extend(
             [
-                ChatCompletionUserMessageParam(content=prompt, role="user"),
-                ChatCompletionAssistantMessageParam(
-                    content=response.completion, role="assistant"
-                ),
+                {"content": prompt, "role": "user"},
+                {"content": response.completion, "role": "assistant"},
             ]
         )
-
-        st.rerun()
-
-    if st.session_state.prompt_sent:
+    elif st.session_state.prompt_sent:
         render_answer_and_citations(
-            answer_and_citations_placeholder,
+            chat_container.container(),
             st.session_state.response,
         )
 
@@ -23,6 +23,7 @@ sys.path.append("..")
 
 from docsassist.deployments import (
     app_env_name,
+    clear_pulumi_outputs_cache,
     rag_deployment_env_name,
 )
 from docsassist.i18n import LocaleSettings
@@ -46,6 +47,10 @@ from infra.settings_global_guardrails import global_guardrails
 
 LocaleSettings().setup_locale()
 
+# outputs cached for the frontend and notebooks are stale once this stack
+# changes; cleared again once the new outputs are known
+clear_pulumi_outputs_cache(pulumi.get_stack())
+
 check_feature_flags(pathlib.Path("feature_flag_requirements.yaml"))
 
 if "DATAROBOT_DEFAULT_USE_CASE" in os.environ:
@@ -212,3 +217,11 @@ pulumi.export(
     settings_app_infra.app_resource_name,
     qa_application.application_url,
 )
+
+# processes reading the outputs during the update cached the previous ones
+pulumi.Output.all(
+    rag_deployment.id,
+    qa_application.id,
+    qa_application.application_url,
+    *[deployment.id for deployment in global_guard_deployments],
+).apply(lambda _: clear_pulumi_outputs_cache(pulumi.get_stack()))
@@ -19,6 +19,7 @@ import textwrap
 import datarobot as dr
 import pulumi
 import pulumi_datarobot as datarobot
+import yaml
 from datarobot_pulumi_utils.schema.custom_models import (
     CustomModelArgs,
     CustomModelResourceBundles,
@@ -39,7 +40,12 @@ from jinja2 import BaseLoader, Environment
 from pydantic import BaseModel
 
 from docsassist.i18n import gettext
-from docsassist.schema import TARGET_COLUMN_NAME, RAGModelSettings, RAGType
+from docsassist.schema import (
+    TARGET_COLUMN_NAME,
+    EmbeddingBackend,
+    RAGModelSettings,
+    RAGType,
+)
 
 from .settings_main import (
     PROJECT_ROOT,
@@ -132,6 +138,8 @@ elif core.rag_type == RAGType.DIY:
 
         vdb: pathlib.Path
         embedding_model: pathlib.Path
+        onnx_embedding_model: pathlib.Path
+        cross_encoder_model: pathlib.Path
         rag_settings: pathlib.Path
 
     diy_rag_deployment_path = PROJECT_ROOT / "deployment_diy_rag"
@@ -139,6 +147,8 @@ elif core.rag_type == RAGType.DIY:
     diy_rag_nb_output = DIYRAGNotebookOutput(
         vdb=diy_rag_deployment_path / "faiss_db",
         embedding_model=diy_rag_deployment_path / "sentencetransformers",
+        onnx_embedding_model=diy_rag_deployment_path / "onnx_embeddings",
+        cross_encoder_model=diy_rag_deployment_path / "cross_encoder",
         rag_settings=diy_rag_deployment_path / RAGModelSettings.filename(),
     )
 
@@ -169,10 +179,43 @@ elif core.rag_type == RAGType.DIY:
 
         docsassist_path = PROJECT_ROOT / "docsassist"
 
+        # only the embedding backend selected by the notebook is uploaded and
+        # installed, and the cross-encoder only when re-ranking is enabled
+        embedding_backend = EmbeddingBackend.SENTENCE_TRANSFORMERS
+        rerank = False
+        if diy_rag_nb_output.rag_settings.exists():
+            with open(diy_rag_nb_output.rag_settings) as f:
+                rag_settings = RAGModelSettings.model_validate(yaml.safe_load(f))
+            embedding_backend = rag_settings.embedding_backend
+            rerank = rag_settings.rerank.enabled
+        sentence_transformers = (
+            embedding_backend == EmbeddingBackend.SENTENCE_TRANSFORMERS
+        )
+        excluded_dirs = []
+        if sentence_transformers:
+            excluded_dirs.append(diy_rag_nb_output.onnx_embedding_model)
+        else:
+            excluded_dirs.append(diy_rag_nb_output.embedding_model)
+        if not rerank:
+            excluded_dirs.append(diy_rag_nb_output.cross_encoder_model)
+
+        with open(diy_rag_deployment_path / "requirements.txt.jinja") as f:
+            template = Environment(loader=BaseLoader()).from_string(f.read())
+        with open(diy_rag_deployment_path / "requirements.txt", "w") as f:
+            requirements = template.render(
+                sentence_transformers=sentence_transformers,
+                onnx=not sentence_transformers,
+                cross_encoder=rerank,
+            )
+            f.write(requirements)
+
         diy_files = [
             (str(f), str(f.relative_to(diy_rag_deployment_path)))
             for f in diy_rag_deployment_path.glob("**/*")
-            if f.is_file() and f.name not in ("README.md", "model-metadata.yaml.jinja")
+            if f.is_file()
+            and f.name
+            not in ("README.md", "model-metadata.yaml.jinja", "requirements.txt.jinja")
+            and not any(f.is_relative_to(excluded) for excluded in excluded_dirs)
         ] + [
             (str(docsassist_path / "__init__.py"), "docsassist/__init__.py"),
             (str(docsassist_path / "schema.py"), "docsassist/schema.py"),
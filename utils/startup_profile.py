@@ -0,0 +1,207 @@
+# Copyright 2024 DataRobot, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Cold-start time of the frontend and the DIY RAG model against a budget.
+
+Each entry point is started in fresh interpreters: its wall time is the
+median over `--repeat` runs, and one more run under `python -X importtime`
+gives the import time per top-level package. Results can be written as JSON
+and compared with an earlier run:
+
+    python -m utils.startup_profile --output startup.json
+    python -m utils.startup_profile --baseline startup.json
+
+The process exits with status 1 when an entry point is over its budget.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+\d+\s+\|\s+(\S+)")
+
+
+@dataclass
+class EntryPoint:
+    name: str
+    cwd: str
+    code: str
+    budget_seconds: float
+
+
+ENTRY_POINTS = {
+    # the Streamlit script run up to its first render, without the server
+    "frontend": EntryPoint(
+        "frontend",
+        os.path.join(ROOT, "frontend"),
+        "from streamlit.testing.v1 import AppTest; "
+        "at = AppTest.from_file('app.py', default_timeout=30).run(); "
+        "assert not at.exception, at.exception",
+        3.0,
+    ),
+    # loaded by the frontend with the first question
+    "first_question": EntryPoint(
+        "first_question",
+        os.path.join(ROOT, "frontend"),
+        "import sys; sys.path.append('..'); "
+        "from docsassist import predict; import datarobot, openai",
+        3.0,
+    ),
+    # imported by DRUM before `load_model`, which --model-dir adds
+    "diy_model": EntryPoint(
+        "diy_model", os.path.join(ROOT, "deployment_diy_rag"), "import custom", 5.0
+    ),
+}
+
+
+def _run(entry_point: EntryPoint, *flags: str) -> subprocess.CompletedProcess[str]:
+    return subprocess.run(
+        [sys.executable, *flags, "-c", entry_point.code],
+        cwd=entry_point.cwd,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Milliseconds spent importing the modules of each top-level package."""
+    packages: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match is not None:
+            self_us, module = match.groups()
+            package = module.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + int(self_us) / 1000
+    return packages
+
+
+def profile(entry_point: EntryPoint, repeat: int, top: int) -> Dict[str, Any]:
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run(entry_point)
+        seconds.append(time.perf_counter() - start)
+    packages = parse_importtime(_run(entry_point, "-X", "importtime").stderr)
+    heaviest = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    return {
+        "seconds": round(statistics.median(seconds), 3),
+        "budget_seconds": entry_point.budget_seconds,
+        "import_ms": round(sum(packages.values()), 1),
+        "packages": {package: round(ms, 1) for package, ms in heaviest},
+    }
+
+
+def print_report(
+    results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]]
+) -> None:
+    for name, result in results.items():
+        change = ""
+        if baseline and name in baseline.get("entry_points", {}):
+            delta = result["seconds"] - baseline["entry_points"][name]["seconds"]
+            change = f" ({delta:+.3f}s)"
+        status = "OK" if result["seconds"] <= result["budget_seconds"] else "OVER"
+        print(
+            f"{name}: {result['seconds']:.3f}s{change} of "
+            f"{result['budget_seconds']:.1f}s budget [{status}]"
+        )
+        print(f"  imports: {result['import_ms']:.1f} ms")
+        for package, ms in result["packages"].items():
+            print(f"  {package:<32} {ms:>9.1f} ms")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "entry_points",
+        nargs="*",
+        metavar="ENTRY_POINT",
+        help=f"entry points to profile, of {', '.join(ENTRY_POINTS)} (default all)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--top", type=int, default=10, help="packages listed")
+    parser.add_argument(
+        "--budget",
+        action="append",
+        default=[],
+        metavar="ENTRY_POINT=SECONDS",
+        help="override the budget of an entry point",
+    )
+    parser.add_argument(
+        "--model-dir",
+        help="also time `load_model` on this DIY RAG custom model folder",
+    )
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare with")
+    args = parser.parse_args(argv)
+    unknown = set(args.entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error(f"unknown entry points: {', '.join(sorted(unknown))}")
+
+    budgets = dict(item.split("=", 1) for item in args.budget)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {}
+    for name in args.entry_points or ENTRY_POINTS:
+        entry_point = ENTRY_POINTS[name]
+        if name in budgets:
+            entry_point = replace(entry_point, budget_seconds=float(budgets[name]))
+        if name == "diy_model" and args.model_dir:
+            entry_point = replace(
+                entry_point,
+                code=f"{entry_point.code}; "
+                f"custom.load_model({os.path.abspath(args.model_dir)!r})",
+            )
+        try:
+            results[name] = profile(entry_point, args.repeat, args.top)
+        except subprocess.CalledProcessError as e:
+            print(f"{name} failed to start:\n{e.stderr}", file=sys.stderr)
+            return 2
+    print_report(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "python": sys.version.split()[0],
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "entry_points": results,
+                },
+                f,
+                indent=2,
+            )
+    over_budget = [
+        name
+        for name, result in results.items()
+        if result["seconds"] > result["budget_seconds"]
+    ]
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())